@@ -0,0 +1,142 @@
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+# === CONFIG ===
+CHAPTERS_DIR = "chapters"
+
+
+def sample_chapters(count, seed):
+    files = sorted(
+        (f for f in os.listdir(CHAPTERS_DIR) if re.fullmatch(r"chapter_\d+\.txt", f)),
+        key=lambda x: int(re.search(r"\d+", x).group()),
+    )
+    return sorted(random.Random(seed).sample(files, min(count, len(files))),
+                  key=lambda x: int(re.search(r"\d+", x).group()))
+
+
+def configure(args, url):
+    """Pipeline settings are read at import time, so they go into the environment first."""
+    os.environ["GROQ_URL"] = url
+    os.environ["OPENROUTER_URL"] = url
+    os.environ["SEGMENT_WORKERS"] = str(args.workers)
+    os.environ["SEGMENT_STREAM"] = "1" if args.stream else "0"
+    os.environ["SEGMENT_WINDOW_TOKENS"] = str(args.window_tokens)
+    os.environ["GROQ_RPM"] = str(args.rpm)
+    os.environ["GROQ_TPM"] = str(args.tpm)
+    os.environ["PRESEGMENT"] = "0" if args.no_presegment else "1"
+    if args.cache:
+        # Never mix mock responses into the real cache.
+        os.environ["LLM_CACHE_PATH"] = os.path.join(tempfile.gettempdir(), "bench_llm_cache.sqlite")
+    else:
+        os.environ["LLM_CACHE"] = "0"
+
+
+def run(args):
+    url = args.url
+    server = None
+    if not url:
+        from mock_llm import start_server
+        server, url = start_server(latency=args.latency, tokens_per_sec=args.tps,
+                                   error_rate=args.error_rate, seed=args.seed)
+    configure(args, url)
+
+    import http_client
+    import llm_segment
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    chapters = sample_chapters(args.chapters, args.seed)
+    llm_segment.get_presegmenter()  # load the cast from the real LLM_output first
+    out_dir = tempfile.mkdtemp(prefix="bench_segment_")
+    llm_segment.OUTPUT_DIR = out_dir
+
+    latencies = []
+    failed = []
+
+    def timed(chapter_file):
+        started = time.monotonic()
+        try:
+            llm_segment.process_chapter(chapter_file)
+        except Exception as e:
+            failed.append((chapter_file, str(e)))
+            return
+        latencies.append(time.monotonic() - started)
+
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+    started = time.monotonic()
+    try:
+        with quiet, ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            list(pool.map(timed, chapters))
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    wall = time.monotonic() - started
+
+    host = urlparse(url).netloc
+    http = http_client.metrics().get(host, {})
+    report = {
+        "chapters": len(latencies),
+        "failed": len(failed),
+        "wall_seconds": round(wall, 2),
+        "chapters_per_min": round(len(latencies) / wall * 60, 2) if wall else 0.0,
+        "chapter_p50_seconds": round(http_client.percentile(latencies, 50), 3),
+        "chapter_p95_seconds": round(http_client.percentile(latencies, 95), 3),
+        "requests": http.get("calls", 0),
+        "request_p50_seconds": round(http.get("p50_seconds", 0.0), 3),
+        "request_p95_seconds": round(http.get("p95_seconds", 0.0), 3),
+        "retries": http.get("retries", 0),
+        "errors": http.get("errors", 0),
+    }
+    if server is not None:
+        report["mock_throttled"] = server.RequestHandlerClass.state.stats()["throttled"]
+        server.shutdown()
+    return report, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Segmentation throughput benchmark (mock LLM by default)")
+    parser.add_argument("--chapters", type=int, default=20, help="number of chapters to sample")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=4, help="chapters in flight (SEGMENT_WORKERS)")
+    parser.add_argument("--stream", action="store_true", help="stream completions (SEGMENT_STREAM=1)")
+    parser.add_argument("--cache", action="store_true", help="use a throwaway LLM cache")
+    parser.add_argument("--no-presegment", action="store_true", help="send whole chapters to the LLM")
+    parser.add_argument("--window-tokens", type=int, default=1500)
+    parser.add_argument("--rpm", type=int, default=100000)
+    parser.add_argument("--tpm", type=int, default=100000000)
+    parser.add_argument("--url", help="existing chat completions endpoint instead of the in-process mock")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock: seconds before the first token")
+    parser.add_argument("--tps", type=float, default=400.0, help="mock: output tokens per second")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock: share of requests answered 429")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's own output")
+    args = parser.parse_args()
+
+    report, failed = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"📊 {report['chapters']} chapters in {report['wall_seconds']}s "
+          f"→ {report['chapters_per_min']} chapters/min")
+    print(f"   chapter latency p50 {report['chapter_p50_seconds']}s, p95 {report['chapter_p95_seconds']}s")
+    print(f"   {report['requests']} requests, p50 {report['request_p50_seconds']}s, "
+          f"p95 {report['request_p95_seconds']}s, {report['retries']} retries, {report['errors']} errors")
+    if "mock_throttled" in report:
+        print(f"   mock answered {report['mock_throttled']} requests with 429")
+    for chapter_file, error in failed:
+        print(f"❌ {chapter_file}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,41 @@
 import os
 import json
+import hashlib
 import sys
 import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict
-import requests
+import http_client
+from corpus_index import CorpusIndex
+from llm_cache import chat_key, get_cache
+from master_store import MasterStore
+from name_detector import NameDetector, chapter_speakers, common_words, excerpt
+from rate_limit import estimate_tokens, limiter_for
 
 # =============================
 # CONFIG
 # =============================
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_URL = os.getenv("GROQ_URL", "https://api.groq.com/openai/v1/chat/completions")
 MODEL = "qwen/qwen3-32b"
 
 CHAPTERS_DIR = "chapters"
 MASTER_FILE = "master_characters.json"
 PROMPT_FILE = "character_prompts.json"
 
+# Detect candidate names locally; only chapters with unseen names go to the LLM,
+# and only the paragraphs that mention them.
+LOCAL_NAME_DETECT = os.getenv("LOCAL_NAME_DETECT", "1") != "0"
+
+# Chapters extracted concurrently. Above 1, every prompt is planned up front
+# and the results are merged in chapter order (first seen still wins).
+CHARACTER_WORKERS = int(os.getenv("CHARACTER_WORKERS", "1"))
+GROQ_RPM = int(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = int(os.getenv("GROQ_TPM", "6000"))
+
+# Keep the chapter full-text / character-mention index in step with the master list.
+CORPUS_INDEX = os.getenv("CORPUS_INDEX", "1") != "0"
+
 chapter_arg = sys.argv[1] if len(sys.argv) > 1 else ""
 
 # =============================
@@ -33,33 +53,37 @@ def call_groq(prompt: str) -> str:
         "temperature": 0.3  # 🔥 lower = more consistent JSON
     }
 
-    res = requests.post(GROQ_URL, headers=headers, json=payload)
+    cache = get_cache()
+    key = chat_key(GROQ_URL, payload)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    limiter = limiter_for(MODEL, GROQ_RPM, GROQ_TPM)
+    # The reply (JSON for a few characters) is small next to the prompt.
+    cost = estimate_tokens(prompt) + 500
+    res = http_client.post(GROQ_URL, headers=headers, json=payload, timeout=120,
+                           limiter=limiter, cost=cost)
 
     if res.status_code != 200:
         raise Exception(res.text)
 
-    return res.json()["choices"][0]["message"]["content"]
+    content = res.json()["choices"][0]["message"]["content"]
+    if cache is not None:
+        cache.put(key, content)
+    return content
 
 # =============================
 # LOAD / SAVE MASTER
 # =============================
-def load_master() -> Dict:
-    if not os.path.exists(MASTER_FILE):
-        return {"characters": {}}
-
-    with open(MASTER_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    # 🔥 Fix corrupted structure
-    if "characters" not in data or not isinstance(data["characters"], dict):
-        return {"characters": {}}
-
-    return data
+def load_master() -> MasterStore:
+    # Snapshot + replayed journal; a corrupt snapshot raises instead of resetting the cast.
+    return MasterStore(MASTER_FILE)
 
 
-def save_master(data: Dict):
-    with open(MASTER_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def save_master(store: MasterStore):
+    store.compact()
 
 # =============================
 # CLEANING / NORMALIZATION
@@ -76,7 +100,8 @@ def clean_text(text: str) -> str:
 
 
 def generate_seed(name: str) -> int:
-    return abs(hash(name)) % (10**8)
+    # hash() is salted per process; a content hash keeps the seed stable across runs.
+    return int(hashlib.sha256(name.encode("utf-8")).hexdigest(), 16) % (10**8)
 
 
 def normalize_character(c: Dict) -> Dict:
@@ -106,7 +131,7 @@ def build_base_prompt(name, c):
     )
 
 
-def generate_prompt_file(master: Dict):
+def generate_prompt_file(master: Dict, index: CorpusIndex = None):
     prompts = {}
 
     for name, c in master["characters"].items():
@@ -117,6 +142,9 @@ def generate_prompt_file(master: Dict):
             "model": c["model"],
             "default_outfit": c["default_outfit"]
         }
+        if index is not None:
+            first = index.first_appearance(name)
+            prompts[name]["first_chapter"] = first[0] if first else None
 
     with open(PROMPT_FILE, "w", encoding="utf-8") as f:
         json.dump(prompts, f, indent=2, ensure_ascii=False)
@@ -158,6 +186,40 @@ SCRIPT:
 {script}
 """
 
+def build_candidate_prompt(excerpt_text: str, names: list) -> str:
+    return f"""
+Return ONLY valid JSON. No explanation.
+
+FORMAT:
+{{
+  "characters": [
+    {{
+      "name": "",
+      "gender": "",
+      "age_range": "",
+      "body_build": "",
+      "face_shape": "",
+      "eyes": "",
+      "hair": "",
+      "clothing": "",
+      "signature_item": ""
+    }}
+  ]
+}}
+
+RULES:
+- Only describe these names, and only if they are people: {names}
+- Skip places, sects, families, titles and objects
+- Use the exact name as written above
+- Do NOT include emotions in eyes
+- Do NOT include aura
+- Keep descriptions visual only
+- clothing = default outfit (not scene specific)
+
+EXCERPT:
+{excerpt_text}
+"""
+
 # =============================
 # JSON EXTRACTION
 # =============================
@@ -170,8 +232,8 @@ def extract_json(text: str) -> Dict:
 # =============================
 # MERGE
 # =============================
-def merge_characters(master: Dict, new_chars: Dict) -> Dict:
-    chars = master["characters"]
+def merge_characters(store: MasterStore, new_chars: Dict) -> MasterStore:
+    chars = store.data["characters"]
 
     for c in new_chars.get("characters", []):
         name = c.get("name")
@@ -179,16 +241,57 @@ def merge_characters(master: Dict, new_chars: Dict) -> Dict:
             continue
 
         if name not in chars:
-            chars[name] = normalize_character(c)
+            store.add_character(name, normalize_character(c))
 
-    return master
+    return store
 
 # =============================
 # PROCESS
 # =============================
-def process_chapters():
-    master = load_master()
-
+def chapter_prompt(master: Dict, chapter_num: str, script: str, claimed=()):
+    """(prompt, names) for one chapter; prompt is None when it has no unseen names.
+
+    `claimed` names are treated as known: they are already being asked
+    about for an earlier chapter.
+    """
+    if not LOCAL_NAME_DETECT:
+        return build_character_prompt(script, list(master["characters"].keys())), []
+
+    known = list(master["characters"]) + master.get("screened", []) + list(claimed)
+    names = NameDetector(known, common=common_words()).unseen(script, chapter_speakers(chapter_num))
+    if not names:
+        return None, names
+    return build_candidate_prompt(excerpt(script, names), names), names
+
+
+def extract_characters(prompt):
+    """LLM call for one chapter; None when the reply is not usable JSON."""
+    if prompt is None:
+        return {"characters": []}
+    response = call_groq(prompt)
+    try:
+        return extract_json(response)
+    except Exception:
+        print("❌ JSON parse failed")
+        print(response)
+        return None
+
+
+def record_chapter(store: MasterStore, chapter_num: str, names: list, new_chars: Dict):
+    merge_characters(store, new_chars)
+    if names:
+        # Names the LLM was shown but did not describe are not asked about again.
+        store.add_screened(names)
+
+    out_file = os.path.join(CHAPTERS_DIR, f"chapter_{chapter_num}_characters.json")
+    with open(out_file, "w", encoding="utf-8") as f:
+        json.dump(new_chars, f, indent=2, ensure_ascii=False)
+
+    print(f"✅ Saved: {out_file}")
+
+
+def read_chapters():
+    """(chapter_num, text) in chapter order, honouring the chapter argument."""
     chapter_files = sorted(
         [f for f in os.listdir(CHAPTERS_DIR) if f.startswith("chapter_") and f.endswith(".txt")],
         key=lambda x: int(re.search(r"\d+", x).group())
@@ -200,33 +303,75 @@ def process_chapters():
         if chapter_arg and chapter_num != str(chapter_arg):
             continue
 
-        print(f"\n🚀 Processing Chapter {chapter_num}")
-
         with open(os.path.join(CHAPTERS_DIR, chapter_file), "r", encoding="utf-8") as f:
-            script = f.read()
+            yield chapter_num, f.read()
+
 
-        existing_names = list(master["characters"].keys())
+def process_sequential(store: MasterStore):
+    for chapter_num, script in read_chapters():
+        print(f"\n🚀 Processing Chapter {chapter_num}")
 
-        prompt = build_character_prompt(script, existing_names)
-        response = call_groq(prompt)
+        prompt, names = chapter_prompt(store.data, chapter_num, script)
+        if prompt is None:
+            print("⏭ No new names, skipping LLM")
+        elif names:
+            print(f"🔎 New names: {', '.join(names)}")
 
-        try:
-            new_chars = extract_json(response)
-        except Exception:
-            print("❌ JSON parse failed")
-            print(response)
+        new_chars = extract_characters(prompt)
+        if new_chars is None:
             continue
+        record_chapter(store, chapter_num, names, new_chars)
+
+
+def process_parallel(store: MasterStore, workers: int):
+    """Plan every chapter's prompt locally, extract concurrently, merge in chapter order.
+
+    A name is claimed by the first chapter it is unseen in, so planning
+    matches what the sequential run would ask. pool.map yields results in
+    submission order, so the merge (and "first seen wins") is
+    deterministic however the calls finish.
+    """
+    plan = []
+    claimed = set()
+    for chapter_num, script in read_chapters():
+        prompt, names = chapter_prompt(store.data, chapter_num, script, claimed)
+        claimed.update(names)
+        plan.append((chapter_num, prompt, names))
+
+    calls = sum(1 for _, prompt, _ in plan if prompt is not None)
+    print(f"🧭 {len(plan)} chapters planned, {calls} need the LLM, {workers} in flight")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(extract_characters, [prompt for _, prompt, _ in plan])
+        for (chapter_num, prompt, names), new_chars in zip(plan, results):
+            print(f"\n🚀 Chapter {chapter_num}" + (f": {', '.join(names)}" if names else ""))
+            if new_chars is None:
+                continue
+            record_chapter(store, chapter_num, names, new_chars)
+
+
+def process_chapters():
+    store = load_master()
+    master = store.data
+
+    if CHARACTER_WORKERS > 1:
+        process_parallel(store, CHARACTER_WORKERS)
+    else:
+        process_sequential(store)
 
-        master = merge_characters(master, new_chars)
-        save_master(master)
+    save_master(store)
 
-        out_file = os.path.join(CHAPTERS_DIR, f"chapter_{chapter_num}_characters.json")
-        with open(out_file, "w", encoding="utf-8") as f:
-            json.dump(new_chars, f, indent=2, ensure_ascii=False)
+    index = None
+    if CORPUS_INDEX:
+        index = CorpusIndex()
+        indexed, _, added = index.update(CHAPTERS_DIR, master["characters"])
+        print(f"🗂 Corpus index: {indexed} chapters re-indexed, {added} new names")
 
-        print(f"✅ Saved: {out_file}")
+    generate_prompt_file(master, index)
 
-    generate_prompt_file(master)
+    if get_cache() is not None:
+        print(f"📦 {get_cache().summary()}")
+    print(f"🌐 {http_client.metrics_summary()}")
 
 # =============================
 # MAIN
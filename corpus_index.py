@@ -0,0 +1,222 @@
+import glob
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+
+from master_store import MasterStore
+
+# === CONFIG ===
+CHAPTERS_DIR = "chapters"
+MASTER_FILE = "master_characters.json"
+INDEX_PATH = os.getenv("CORPUS_INDEX_PATH", ".cache/corpus_index.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chapters (
+    chapter INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chapter_text USING fts5(body, tokenize='unicode61');
+CREATE TABLE IF NOT EXISTS names (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS mentions (
+    name TEXT NOT NULL,
+    chapter INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    PRIMARY KEY (name, chapter, offset)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS mentions_by_chapter ON mentions (chapter, name);
+"""
+
+
+def _chapter_num(path):
+    return int(re.search(r"(\d+)", os.path.basename(path)).group(1))
+
+
+def _name_pattern(names):
+    """One alternation for all names, longest first so "Chen Ping" beats "Chen"."""
+    ordered = sorted(names, key=len, reverse=True)
+    return re.compile(r"\b(" + "|".join(re.escape(n) for n in ordered) + r")\b")
+
+
+def find_mentions(text, names):
+    """(name, char offset) for every whole-word occurrence of `names` in `text`."""
+    if not names:
+        return []
+    return [(m.group(1), m.start()) for m in _name_pattern(names).finditer(text)]
+
+
+class CorpusIndex:
+    """Full-text index of chapters/ plus (character, chapter, offset) postings.
+
+    The chapter text lives in an FTS5 table keyed by chapter number. Only
+    chapters whose content hash changed are re-indexed, and mentions are
+    only scanned for names that are new to the index.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # === INDEXING ===
+    def update(self, chapters_dir=CHAPTERS_DIR, names=()):
+        """Bring the index up to date with `chapters_dir` and the character `names`.
+
+        Returns (chapters_indexed, chapters_removed, names_added).
+        """
+        names = set(names)
+        stored = {row[0]: row[1:] for row in self.conn.execute("SELECT chapter, hash, size, mtime FROM chapters")}
+        indexed_names = {row[0] for row in self.conn.execute("SELECT name FROM names")}
+
+        seen, fresh = set(), set()
+        with self.conn:
+            for path in glob.glob(os.path.join(chapters_dir, "chapter_*.txt")):
+                chapter = _chapter_num(path)
+                seen.add(chapter)
+                stat = os.stat(path)
+                old = stored.get(chapter)
+                if old and old[1] == stat.st_size and old[2] == stat.st_mtime:
+                    continue
+                with open(path, "rb") as f:
+                    data = f.read()
+                digest = hashlib.sha1(data).hexdigest()
+                if old and old[0] == digest:
+                    self.conn.execute("UPDATE chapters SET mtime = ? WHERE chapter = ?",
+                                      (stat.st_mtime, chapter))
+                    continue
+                self._index_chapter(chapter, data.decode("utf-8"), digest, stat, names)
+                fresh.add(chapter)
+
+            removed = set(stored) - seen
+            for chapter in removed:
+                self._drop_chapter(chapter)
+
+            dropped_names = indexed_names - names
+            if dropped_names:
+                self._drop_names(dropped_names, names)
+
+            new_names = names - indexed_names
+            if new_names:
+                self._scan_names(new_names, names, skip=fresh)
+        return len(fresh), len(removed), len(new_names)
+
+    def _drop_chapter(self, chapter):
+        self.conn.execute("DELETE FROM chapters WHERE chapter = ?", (chapter,))
+        self.conn.execute("DELETE FROM chapter_text WHERE rowid = ?", (chapter,))
+        self.conn.execute("DELETE FROM mentions WHERE chapter = ?", (chapter,))
+
+    def _index_chapter(self, chapter, text, digest, stat, names):
+        self._drop_chapter(chapter)
+        self.conn.execute("INSERT INTO chapters (chapter, hash, size, mtime) VALUES (?, ?, ?, ?)",
+                          (chapter, digest, stat.st_size, stat.st_mtime))
+        self.conn.execute("INSERT INTO chapter_text (rowid, body) VALUES (?, ?)", (chapter, text))
+        self.conn.executemany("INSERT OR IGNORE INTO mentions (name, chapter, offset) VALUES (?, ?, ?)",
+                              [(n, chapter, o) for n, o in find_mentions(text, names)])
+
+    def _repost(self, chapters, names):
+        """Recompute every posting in `chapters` against the full name set."""
+        for chapter in chapters:
+            text = self.text(chapter)
+            self.conn.execute("DELETE FROM mentions WHERE chapter = ?", (chapter,))
+            self.conn.executemany("INSERT OR IGNORE INTO mentions (name, chapter, offset) VALUES (?, ?, ?)",
+                                  [(n, chapter, o) for n, o in find_mentions(text, names)])
+
+    def _drop_names(self, dropped, names):
+        marks = ",".join("?" * len(dropped))
+        chapters = [row[0] for row in self.conn.execute(
+            f"SELECT DISTINCT chapter FROM mentions WHERE name IN ({marks})", tuple(dropped))]
+        self.conn.execute(f"DELETE FROM names WHERE name IN ({marks})", tuple(dropped))
+        # A shorter name may have been hiding inside the dropped one.
+        self._repost(chapters, names)
+
+    def _scan_names(self, new_names, names, skip=()):
+        """Re-post the chapters that mention a new name, found through FTS.
+
+        Matching runs against the full name set, so adding "Chen Ping"
+        after "Chen" moves those offsets to the longer name.
+        """
+        phrase = " OR ".join('"' + n.replace('"', '""') + '"' for n in new_names)
+        chapters = [row[0] for row in self.conn.execute(
+            "SELECT rowid FROM chapter_text WHERE chapter_text MATCH ?", (phrase,)) if row[0] not in skip]
+        self._repost(chapters, names)
+        self.conn.executemany("INSERT OR IGNORE INTO names (name) VALUES (?)", [(n,) for n in new_names])
+
+    # === QUERIES ===
+    def search(self, query, limit=20):
+        """FTS5 query -> [(chapter, snippet)], best match first."""
+        return self.conn.execute(
+            "SELECT rowid, snippet(chapter_text, 0, '[', ']', '…', 12) FROM chapter_text "
+            "WHERE chapter_text MATCH ? ORDER BY rank LIMIT ?", (query, limit)
+        ).fetchall()
+
+    def chapters_mentioning(self, name):
+        return [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT chapter FROM mentions WHERE name = ? ORDER BY chapter", (name,))]
+
+    def first_appearance(self, name):
+        """(chapter, offset) of the first mention, or None."""
+        return self.conn.execute(
+            "SELECT chapter, offset FROM mentions WHERE name = ? ORDER BY chapter, offset LIMIT 1", (name,)
+        ).fetchone()
+
+    def mentions(self, name, chapter=None):
+        if chapter is None:
+            return self.conn.execute(
+                "SELECT chapter, offset FROM mentions WHERE name = ? ORDER BY chapter, offset", (name,)
+            ).fetchall()
+        return [row[0] for row in self.conn.execute(
+            "SELECT offset FROM mentions WHERE name = ? AND chapter = ? ORDER BY offset", (name, chapter))]
+
+    def names_in_chapter(self, chapter):
+        """{name: mention count} for one chapter."""
+        return dict(self.conn.execute(
+            "SELECT name, COUNT(*) FROM mentions WHERE chapter = ? GROUP BY name ORDER BY COUNT(*) DESC",
+            (int(chapter),)))
+
+    def text(self, chapter):
+        row = self.conn.execute("SELECT body FROM chapter_text WHERE rowid = ?", (int(chapter),)).fetchone()
+        return row[0] if row else None
+
+
+def master_names(master_file=MASTER_FILE):
+    return list(MasterStore(master_file).data["characters"])
+
+
+def update_index(path=INDEX_PATH, chapters_dir=CHAPTERS_DIR, master_file=MASTER_FILE):
+    """Open the index and refresh it against chapters/ and the master character list."""
+    index = CorpusIndex(path)
+    index.update(chapters_dir, master_names(master_file))
+    return index
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "--update":
+        index = CorpusIndex()
+        indexed, removed, added = index.update(CHAPTERS_DIR, master_names())
+        print(f"📌 {INDEX_PATH}: {indexed} chapters indexed, {removed} removed, {added} new names")
+    elif command == "--search" and len(sys.argv) > 2:
+        for chapter, snippet in update_index().search(sys.argv[2]):
+            print(f"chapter_{chapter}: {snippet}")
+    elif command == "--where" and len(sys.argv) > 2:
+        index = update_index()
+        name = sys.argv[2]
+        first = index.first_appearance(name)
+        chapters = index.chapters_mentioning(name)
+        if first:
+            print(f"{name}: first in chapter_{first[0]} at offset {first[1]}, mentioned in {len(chapters)} chapters")
+        else:
+            print(f"{name}: no mentions (is it in {MASTER_FILE}?)")
+    else:
+        print("usage: python corpus_index.py --update | --search QUERY | --where NAME")
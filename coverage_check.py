@@ -0,0 +1,153 @@
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+
+# === CONFIG ===
+MIN_GAP_WORDS = 3   # smaller differences are pronoun rewrites and the like, not lost text
+
+WORD_RE = re.compile(r"[^\W_]+")
+INTRO_RE = re.compile(r"^narrator\t[^\t]*\t[^\t]*\t.+ speaks\.$")
+
+
+class Gap:
+    """A stretch of the chapter that is missing from (or repeated in) the script."""
+    __slots__ = ("kind", "start", "end", "text", "at")
+
+    def __init__(self, kind, start, end, text, at):
+        self.kind = kind      # "dropped" or "duplicated"
+        self.start = start    # char offsets into the source (dropped) ...
+        self.end = end        # ... or row indices into the script (duplicated)
+        self.text = text
+        self.at = at          # script row the repair goes before
+
+    def __repr__(self):
+        return f"Gap({self.kind}, {self.start}:{self.end}, {self.text[:40]!r})"
+
+
+def _source_words(text):
+    return [(m.group().lower(), m.start(), m.end()) for m in WORD_RE.finditer(text)]
+
+
+def _script_words(rows):
+    """Words of the Text column, each tagged with its row; speaker intros are skipped."""
+    words = []
+    for r, row in enumerate(rows):
+        if INTRO_RE.match(row):
+            continue
+        for m in WORD_RE.finditer(row.split("\t")[-1]):
+            words.append((m.group().lower(), r))
+    return words
+
+
+def _runs(indices):
+    """Sorted row indices -> (first, last + 1) runs of consecutive rows."""
+    runs = []
+    for r in sorted(indices):
+        if runs and runs[-1][1] == r:
+            runs[-1][1] = r + 1
+        else:
+            runs.append([r, r + 1])
+    return runs
+
+
+def find_gaps(source, rows):
+    """Align the script's Text column against the source text, word by word.
+
+    Punctuation, quotes and whitespace are ignored. Returns dropped source
+    spans of at least MIN_GAP_WORDS words and duplicated script rows: rows
+    inside an unaligned stretch whose words repeat source text or an
+    earlier row, and rows that repeat the row before them without being
+    aligned themselves.
+    """
+    src = _source_words(source)
+    out = _script_words(rows)
+    matcher = SequenceMatcher(None, [w for w, _, _ in src], [w for w, _ in out], autojunk=False)
+    opcodes = matcher.get_opcodes()
+    source_key = " " + " ".join(w for w, _, _ in src) + " "
+
+    row_words = defaultdict(list)
+    for j, (w, r) in enumerate(out):
+        row_words[r].append(j)
+    row_text = {r: " " + " ".join(out[j][0] for j in js) + " " for r, js in row_words.items()}
+    first_seen = {}
+    for r in sorted(row_text):
+        first_seen.setdefault(row_text[r], r)
+    aligned = {out[j][1] for op, _, _, j1, j2 in opcodes if op == "equal" for j in range(j1, j2)}
+
+    gaps = []
+    duplicated = set()
+    for op, i1, i2, j1, j2 in opcodes:
+        missing = i2 - i1 if op in ("delete", "replace") else 0
+        extra = j2 - j1 if op in ("insert", "replace") else 0
+
+        # Checked row by row, so a repetition loop or a re-emitted script is
+        # caught even where the whole stretch is not one run of the source.
+        repeated = 0
+        if extra >= MIN_GAP_WORDS:
+            for r in sorted({out[j][1] for j in range(j1, j2)}):
+                js = row_words[r]
+                if r in aligned or js[0] < j1 or js[-1] >= j2:
+                    continue
+                if row_text[r] in source_key or first_seen[row_text[r]] < r:
+                    duplicated.add(r)
+                    repeated += len(js)
+
+        if missing >= MIN_GAP_WORDS and (extra - repeated) < missing / 2:
+            if j1 >= len(out):
+                at = len(rows)
+            else:
+                row = out[j1][1]
+                starts_row = j1 == 0 or out[j1 - 1][1] != row
+                at = row if starts_row else row + 1
+            start, end = src[i1][1], src[i2 - 1][2]
+            gaps.append(Gap("dropped", start, end, source[start:end], at))
+
+    # Consecutive identical rows (speaker intros included) are never both meant.
+    for r in range(1, len(rows)):
+        if rows[r] == rows[r - 1] and r not in aligned:
+            duplicated.add(r)
+    # Rows without words (intros) go with the duplicated rows around them.
+    previous = False
+    for r in range(len(rows)):
+        if r in row_words:
+            previous = r in duplicated
+        elif previous:
+            following = next((n for n in range(r + 1, len(rows)) if n in row_words), None)
+            if following is None or following in duplicated:
+                duplicated.add(r)
+
+    for first, end in _runs(duplicated):
+        gaps.append(Gap("duplicated", first, end, "\n".join(rows[first:end]), first))
+    return gaps
+
+
+def repair(source, script, segment_fn, workers=4):
+    """Re-segment only the dropped spans and drop duplicated rows.
+
+    `segment_fn(text)` must return TSV rows for a piece of the chapter.
+    Returns (repaired_script, gaps_found).
+    """
+    rows = [r for r in script.split("\n") if r.strip()]
+    gaps = find_gaps(source, rows)
+    if not gaps:
+        return script, gaps
+
+    dropped = [g for g in gaps if g.kind == "dropped"]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        patches = list(pool.map(lambda g: segment_fn(g.text), dropped))
+
+    remove = set()
+    for g in gaps:
+        if g.kind == "duplicated":
+            remove.update(range(g.start, g.end))
+    inserts = {}
+    for g, patch in zip(dropped, patches):
+        inserts.setdefault(g.at, []).extend(r for r in patch.split("\n") if r.strip())
+
+    out = []
+    for r in range(len(rows) + 1):
+        out.extend(inserts.get(r, []))
+        if r < len(rows) and r not in remove:
+            out.append(rows[r])
+    return "\n".join(out), gaps
@@ -6,8 +6,11 @@ import json
 import re
 import logging
 import edge_tts
+import functools
 from pydub import AudioSegment
 
+import tts_cache
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger("StoryBot")
 
@@ -99,12 +102,15 @@ async def generate_audiobook(data, output_filename="output.mp3"):
             
             # Generate audio for line
             output_file = os.path.join(tmpdir, f"line_{idx}.mp3")
-            tasks.append(generate_audio_chunk(text, voice, output_file))
+            key = tts_cache.clip_key("edge-tts", getattr(edge_tts, "__version__", None), voice, text)
+            tasks.append(tts_cache.cached(key, output_file,
+                                          functools.partial(generate_audio_chunk, text, voice, output_file)))
             audio_files.append(output_file)
             audio_files.append(silence_file)  # Add silence after each line
         
         # Run all TTS tasks concurrently
         await asyncio.gather(*tasks)
+        logger.info(tts_cache.summary())
         
         # Combine all audio segments
         if audio_files:
@@ -0,0 +1,160 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from rate_limit import backoff_delay
+
+# === CONFIG ===
+DEFAULT_TIMEOUT = 60
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "5"))
+MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "8"))
+
+_local = threading.local()
+_host_slots = {}
+_lock = threading.Lock()
+LATENCY_SAMPLES = 4096  # recent request latencies kept per host for percentiles
+
+_metrics = defaultdict(lambda: {"calls": 0, "retries": 0, "errors": 0, "seconds": 0.0,
+                                "samples": deque(maxlen=LATENCY_SAMPLES)})
+
+
+def get_session():
+    """Per-thread pooled Session, so every call to a host reuses its keep-alive connection."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=MAX_PER_HOST)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _local.session = session
+    return session
+
+
+def _slot(host):
+    with _lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(MAX_PER_HOST)
+        return _host_slots[host]
+
+
+def _count(stats, key, amount=1):
+    with _lock:
+        stats[key] += amount
+
+
+def _rewind(files):
+    """Seek file uploads back to the start so a retried POST resends them."""
+    for value in (files or {}).values():
+        fileobj = value[1] if isinstance(value, tuple) else value
+        if hasattr(fileobj, "seek"):
+            fileobj.seek(0)
+
+
+def _unsent(error):
+    """True when a failed attempt never reached the server (refused, DNS, connect timeout)."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def request(method, url, *, timeout=DEFAULT_TIMEOUT, max_retries=MAX_RETRIES,
+            limiter=None, cost=1, idempotent=True, **kwargs):
+    """Send a request over the pooled session.
+
+    429/5xx responses and connection errors/timeouts are retried with
+    jittered backoff (honouring Retry-After). With idempotent=False (a
+    Telegram upload, say) only 429s and attempts that never reached the
+    server are retried, since a read timeout may follow a request the
+    server already acted on. With a rate_limit.RateLimiter
+    every attempt is charged `cost` tokens, the limiter is synced from the
+    response headers, and a 429 pauses everyone sharing it. The final
+    response is returned as-is; callers still decide what a bad status means.
+    """
+    host = urlparse(url).netloc
+    stats = _metrics[host]
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire(cost)
+        _rewind(kwargs.get("files"))
+        started = time.monotonic()
+        try:
+            with _slot(host):
+                r = get_session().request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            _count(stats, "errors")
+            if attempt == max_retries or not (idempotent or _unsent(e)):
+                raise
+            delay = backoff_delay(attempt)
+            logging.info(f"⚠ {e.__class__.__name__} from {host}, retrying in {delay:.1f}s")
+            _count(stats, "retries")
+            time.sleep(delay)
+            continue
+        finally:
+            elapsed = time.monotonic() - started
+            _count(stats, "calls")
+            _count(stats, "seconds", elapsed)
+            stats["samples"].append(elapsed)
+
+        if limiter is not None:
+            limiter.update_from_headers(r.headers)
+        retryable = r.status_code == 429 or (idempotent and r.status_code >= 500)
+        if not retryable or attempt == max_retries:
+            return r
+        delay = backoff_delay(attempt, r.headers.get("retry-after"))
+        if r.status_code == 429 and limiter is not None:
+            limiter.pause(delay)
+        logging.info(f"⚠ HTTP {r.status_code} from {host}, retrying in {delay:.1f}s")
+        _count(stats, "retries")
+        r.close()
+        time.sleep(delay)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of `values` (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def metrics():
+    """Per-host call counts, retries, errors and latency (mean, p50, p95)."""
+    out = {}
+    with _lock:
+        snapshot = {host: dict(m, samples=list(m["samples"])) for host, m in _metrics.items()}
+    for host, m in snapshot.items():
+        samples = m.pop("samples")
+        m["mean_seconds"] = m["seconds"] / m["calls"] if m["calls"] else 0.0
+        m["p50_seconds"] = percentile(samples, 50)
+        m["p95_seconds"] = percentile(samples, 95)
+        out[host] = m
+    return out
+
+
+def reset_metrics():
+    with _lock:
+        _metrics.clear()
+
+
+def metrics_summary():
+    return "; ".join(
+        f"{host}: {m['calls']} calls, {m['retries']} retries, {m['errors']} errors, "
+        f"{m['mean_seconds']:.2f}s avg, {m['p95_seconds']:.2f}s p95"
+        for host, m in metrics().items()
+    )
@@ -0,0 +1,365 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# === CONFIG ===
+PROMPTS_FILE = "character_prompts.json"
+OUTPUT_DIR = "assets/characters_new"
+MODEL = "Lykon/DreamShaper"
+STEPS = 60
+SIZE = (512, 512)
+GUIDANCE = 7.5
+# Preview tier: few steps with a fast-converging scheduler, same seeds and prompts,
+# so an approved preview can be promoted to full quality.
+PREVIEW_DIR = "assets/characters_preview"
+PREVIEW_STEPS = 12
+PREVIEW_SCHEDULER = "dpm++"
+
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", ".cache/prompt_embeds")
+
+BASE_QUALITY = ("masterpiece, best quality, ultra detailed, sharp focus, cinematic lighting, "
+                "highly detailed face, perfect anatomy")
+
+# name -> diffusers scheduler class; "default" keeps the one the model ships with.
+SCHEDULERS = {
+    "default": None,
+    "dpm++": "DPMSolverMultistepScheduler",
+    "unipc": "UniPCMultistepScheduler",
+    "euler": "EulerDiscreteScheduler",
+    "euler_a": "EulerAncestralDiscreteScheduler",
+    "ddim": "DDIMScheduler",
+    "pndm": "PNDMScheduler",
+    "lms": "LMSDiscreteScheduler",
+}
+
+
+class RenderOptions:
+    """Everything that decides what an image looks like, plus how it is computed."""
+    __slots__ = ("model", "steps", "width", "height", "guidance", "scheduler", "attention_slicing",
+                 "embed_cache")
+
+    def __init__(self, model=MODEL, steps=STEPS, width=SIZE[0], height=SIZE[1], guidance=GUIDANCE,
+                 scheduler="default", attention_slicing=True, embed_cache=EMBED_CACHE_DIR):
+        self.model = model
+        self.steps = steps
+        self.width = width
+        self.height = height
+        self.guidance = guidance
+        self.scheduler = scheduler
+        self.attention_slicing = attention_slicing
+        self.embed_cache = embed_cache
+
+    def render_key(self, prompt, negative, seed):
+        """Manifest key; non-default scheduler/guidance are appended so old keys stay valid."""
+        fields = [self.model, prompt, negative, seed, self.steps, self.width, self.height]
+        if self.scheduler != "default":
+            fields.append(self.scheduler)
+        if self.guidance != GUIDANCE:
+            fields.append(self.guidance)
+        return hashlib.sha256(json.dumps(fields).encode("utf-8")).hexdigest()
+
+
+class Job:
+    __slots__ = ("name", "tag", "prompt", "negative", "seed", "path", "key")
+
+    def __init__(self, name, tag, prompt, negative, seed, path, key):
+        self.name = name
+        self.tag = tag
+        self.prompt = prompt
+        self.negative = negative
+        self.seed = seed
+        self.path = path
+        self.key = key
+
+
+# === MANIFEST ===
+def manifest_path(output_dir):
+    return os.path.join(output_dir, "manifest.json")
+
+
+def load_manifest(output_dir):
+    path = manifest_path(output_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(output_dir, manifest):
+    path = manifest_path(output_dir)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def character_prompts(base, outfit):
+    """The two shots rendered for every character; seeds are the character seed + index."""
+    return {
+        "character": f"{BASE_QUALITY}, {base}, wearing {outfit}, full body, clean background",
+        "scene": (f"{BASE_QUALITY}, {base}, wearing {outfit}, cinematic scene, detailed environment, "
+                  f"dramatic lighting, depth of field"),
+    }
+
+
+def build_jobs(characters, options, output_dir=OUTPUT_DIR, manifest=None, only=None, force=False):
+    """(jobs, up_to_date): a job for every image whose render key is not already on disk."""
+    manifest = manifest or {}
+    jobs = []
+    up_to_date = 0
+    for name, data in characters.items():
+        if only and name not in only:
+            continue
+        negative = data.get("negative_prompt", "")
+        prompts = character_prompts(data["base_prompt"], data.get("default_outfit", "casual clothes"))
+        for i, (tag, prompt) in enumerate(prompts.items()):
+            path = os.path.join(output_dir, name, f"{tag}.png")
+            seed = data["seed"] + i
+            key = options.render_key(prompt, negative, seed)
+            if not force and manifest.get(path) == key and os.path.exists(path):
+                up_to_date += 1
+                continue
+            jobs.append(Job(name, tag, prompt, negative, seed, path, key))
+    return jobs, up_to_date
+
+
+def batches(jobs, size):
+    return [jobs[i:i + size] for i in range(0, len(jobs), max(1, size))]
+
+
+# === PIPELINE ===
+_pipelines = {}
+
+
+def load_pipeline(options):
+    """Load (once per process) and configure the diffusion pipeline."""
+    cache_key = (options.model, options.scheduler, options.attention_slicing)
+    if cache_key in _pipelines:
+        return _pipelines[cache_key]
+
+    import diffusers
+    import torch
+
+    print(f"🚀 Loading {options.model}...", flush=True)
+    pipe = diffusers.StableDiffusionPipeline.from_pretrained(
+        options.model,
+        torch_dtype=torch.float32,
+        safety_checker=None
+    )
+    if SCHEDULERS[options.scheduler]:
+        scheduler_cls = getattr(diffusers, SCHEDULERS[options.scheduler])
+        pipe.scheduler = scheduler_cls.from_config(pipe.scheduler.config)
+    pipe = pipe.to("cpu")
+    if options.attention_slicing:
+        pipe.enable_attention_slicing()
+    pipe.set_progress_bar_config(disable=True)
+    _pipelines[cache_key] = pipe
+    return pipe
+
+
+_embeds = {}
+
+
+def embed_prompt(pipe, options, text):
+    """CLIP embedding of one prompt, cached in memory and under options.embed_cache.
+
+    Keyed by (model, text encoder, text), so the character and scene shots,
+    re-renders and seed sweeps never encode the same text twice.
+    """
+    import torch
+
+    encoder = type(pipe.text_encoder).__name__
+    key = hashlib.sha256(json.dumps([options.model, encoder, text]).encode("utf-8")).hexdigest()
+    if key in _embeds:
+        return _embeds[key]
+
+    path = os.path.join(options.embed_cache, f"{key}.pt") if options.embed_cache else None
+    if path and os.path.exists(path):
+        embeds = torch.load(path)
+    else:
+        with torch.no_grad():
+            embeds = pipe.encode_prompt(text, "cpu", 1, False)[0]
+        if path:
+            os.makedirs(options.embed_cache, exist_ok=True)
+            tmp = path + ".tmp"
+            torch.save(embeds, tmp)
+            os.replace(tmp, path)
+    _embeds[key] = embeds
+    return embeds
+
+
+def render_batch(options, batch):
+    """Render jobs in one denoising pass; each image keeps its own seeded generator,
+    so a batched image matches the one rendered alone."""
+    import torch
+
+    pipe = load_pipeline(options)
+    # An empty negative prompt embeds exactly like the pipeline's own unconditional input.
+    prompt_embeds = torch.cat([embed_prompt(pipe, options, job.prompt) for job in batch])
+    negative_embeds = torch.cat([embed_prompt(pipe, options, job.negative) for job in batch])
+    images = pipe(
+        prompt_embeds=prompt_embeds,
+        negative_prompt_embeds=negative_embeds,
+        num_inference_steps=options.steps,
+        guidance_scale=options.guidance,
+        generator=[torch.Generator("cpu").manual_seed(job.seed) for job in batch],
+        height=options.height,
+        width=options.width
+    ).images
+    for job, image in zip(batch, images):
+        os.makedirs(os.path.dirname(job.path), exist_ok=True)
+        image.save(job.path)
+    return [(job.path, job.key) for job in batch]
+
+
+def _init_worker(threads):
+    import torch
+    torch.set_num_threads(threads)
+
+
+def render(jobs, options, batch_size=1, workers=1, threads=None, on_done=None):
+    """Render `jobs`, `batch_size` prompts per pass, over `workers` processes.
+
+    CPU threads (default: all cores) are split evenly between workers, so
+    two workers do not fight over the same cores. `on_done(path, key)` is
+    called as each image lands.
+    """
+    threads = threads or os.cpu_count() or 1
+    work = batches(jobs, batch_size)
+
+    def finished(done):
+        for path, key in done:
+            print(f"   ✅ Saved: {path}", flush=True)
+            if on_done:
+                on_done(path, key)
+
+    if workers <= 1:
+        _init_worker(threads)
+        for batch in work:
+            finished(render_batch(options, batch))
+        return
+
+    per_worker = max(1, threads // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(per_worker,)) as pool:
+        futures = [pool.submit(render_batch, options, batch) for batch in work]
+        for future in as_completed(futures):
+            finished(future.result())
+
+
+def benchmark(characters, options, count, batch_size, workers, threads):
+    """Render `count` throwaway images of the first character and report seconds/image."""
+    name, data = next(iter(characters.items()))
+    prompt = character_prompts(data["base_prompt"], data.get("default_outfit", "casual clothes"))["character"]
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = [Job(name, f"bench{i}", prompt, data.get("negative_prompt", ""), data["seed"] + i,
+                    os.path.join(tmp, f"bench_{i}.png"), "") for i in range(count)]
+        if workers <= 1:
+            started = time.monotonic()
+            load_pipeline(options)
+            print(f"⏱ Model load: {time.monotonic() - started:.1f}s")
+        started = time.monotonic()
+        render(jobs, options, batch_size, workers, threads)
+        wall = time.monotonic() - started
+    print(f"⏱ {count} images at {options.width}x{options.height}, {options.steps} steps, "
+          f"scheduler {options.scheduler}, batch {batch_size}, {workers} workers: "
+          f"{wall / count:.1f}s per image ({wall:.1f}s total)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render character images from character_prompts.json")
+    parser.add_argument("--prompts", default=PROMPTS_FILE)
+    parser.add_argument("--out", default=OUTPUT_DIR)
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--steps", type=int, default=STEPS)
+    parser.add_argument("--width", type=int, default=SIZE[0])
+    parser.add_argument("--height", type=int, default=SIZE[1])
+    parser.add_argument("--guidance", type=float, default=GUIDANCE)
+    parser.add_argument("--scheduler", choices=sorted(SCHEDULERS), default="default",
+                        help="dpm++ / unipc reach similar quality in ~25 steps")
+    parser.add_argument("--no-attention-slicing", action="store_true",
+                        help="faster when RAM allows it")
+    parser.add_argument("--embed-cache", default=EMBED_CACHE_DIR,
+                        help="directory for cached prompt embeddings ('' to disable)")
+    parser.add_argument("--batch-size", type=int, default=2, help="prompts per denoising pass")
+    parser.add_argument("--workers", type=int, default=1, help="render processes (each loads the model)")
+    parser.add_argument("--threads", type=int, help="total CPU threads to split across workers")
+    parser.add_argument("--only", nargs="*", help="character names to render")
+    parser.add_argument("--force", action="store_true", help="ignore the manifest and re-render")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="render N throwaway images and time them")
+    parser.add_argument("--preview", action="store_true", help="render the fast preview tier instead")
+    parser.add_argument("--preview-dir", default=PREVIEW_DIR)
+    parser.add_argument("--preview-steps", type=int, default=PREVIEW_STEPS)
+    parser.add_argument("--preview-size", type=int, help="square preview size (default: full size)")
+    parser.add_argument("--preview-scheduler", choices=sorted(SCHEDULERS), default=PREVIEW_SCHEDULER)
+    parser.add_argument("--promote", nargs="*", metavar="NAME",
+                        help="render approved previews at full quality (no names: list candidates)")
+    args = parser.parse_args()
+
+    options = RenderOptions(args.model, args.steps, args.width, args.height, args.guidance,
+                            args.scheduler, not args.no_attention_slicing, args.embed_cache)
+    preview = RenderOptions(args.model, args.preview_steps, args.preview_size or args.width,
+                            args.preview_size or args.height, args.guidance, args.preview_scheduler,
+                            not args.no_attention_slicing, args.embed_cache)
+    with open(args.prompts, "r", encoding="utf-8") as f:
+        characters = json.load(f)
+
+    if args.benchmark:
+        benchmark(characters, preview if args.preview else options, args.benchmark,
+                  args.batch_size, args.workers, args.threads)
+        return
+
+    if args.preview:
+        run_tier(characters, preview, args.preview_dir, args, args.only)
+        print(f"👀 Review {args.preview_dir}, then: python image_gen.py --promote NAME ...")
+    elif args.promote is not None:
+        approved = previewed(characters, preview, args.preview_dir)
+        if not args.promote:
+            pending = [n for n in approved if build_jobs(characters, options, args.out,
+                                                         load_manifest(args.out), [n])[0]]
+            print("Previews awaiting promotion: " + (", ".join(pending) or "none"))
+            return
+        for name in args.promote:
+            if name not in approved:
+                print(f"⚠ {name} has no up-to-date preview; render one with --preview first")
+        run_tier(characters, options, args.out, args, [n for n in args.promote if n in approved])
+    else:
+        run_tier(characters, options, args.out, args, args.only)
+
+
+def previewed(characters, preview, preview_dir):
+    """Characters whose preview images are current for their prompts and seeds."""
+    manifest = load_manifest(preview_dir)
+    names = []
+    for name in characters:
+        jobs, up_to_date = build_jobs(characters, preview, preview_dir, manifest, [name])
+        if up_to_date and not jobs:
+            names.append(name)
+    return names
+
+
+def run_tier(characters, options, output_dir, args, only):
+    """Render whatever in `output_dir` is missing or stale for `options`."""
+    if only == []:
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+    jobs, up_to_date = build_jobs(characters, options, output_dir, manifest, only, args.force)
+    print(f"🧾 {len(jobs)} images to render at {options.steps} steps, {up_to_date} up to date")
+    if not jobs:
+        return
+
+    def on_done(path, key):
+        manifest[path] = key
+        save_manifest(output_dir, manifest)
+
+    started = time.monotonic()
+    render(jobs, options, args.batch_size, args.workers, args.threads, on_done)
+    elapsed = time.monotonic() - started
+    print(f"\n🎉 Generation complete! {len(jobs)} images in {elapsed:.0f}s ({elapsed / len(jobs):.1f}s per image)")
+
+if __name__ == "__main__":
+    main()
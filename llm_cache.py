@@ -0,0 +1,55 @@
+import hashlib
+import json
+import os
+import threading
+
+from lru_store import LRUStore
+
+# === CONFIG ===
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite")
+CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "256"))
+CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+
+
+def chat_key(url, data):
+    """Content hash of everything that determines a chat completion's output."""
+    messages = data.get("messages", [])
+    system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+    user = "\n".join(m["content"] for m in messages if m["role"] != "system")
+    blob = json.dumps(
+        [url, data.get("model"), system, user, data.get("temperature")],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class LLMCache(LRUStore):
+    """SQLite-backed response cache with size-bounded LRU eviction."""
+
+    table = "llm_responses"
+    value_type = "TEXT"
+    label = "LLM cache"
+
+    def __init__(self, path=CACHE_PATH, max_bytes=int(CACHE_MAX_MB * 1024 * 1024)):
+        super().__init__(path, max_bytes)
+
+    def get(self, key):
+        return self._get(key)
+
+    def put(self, key, response):
+        self._put(key, response, len(response.encode("utf-8")))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide cache, or None when disabled with LLM_CACHE=0."""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
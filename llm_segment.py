@@ -1,10 +1,18 @@
 import os
 import json
 import re
-import time
-import requests
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+import http_client
+from coverage_check import repair
+from llm_cache import chat_key, get_cache
+from normalizer import normalize
+from presegment import PreSegmenter, Renderer, Splicer, llm_input, load_cast
+from rate_limit import estimate_tokens, limiter_for
+from script_store import parse_tsv, tsv_row, tsv_text, write_script
 
 # === CONFIG ===
 CHAPTERS_DIR = "chapters"
@@ -16,6 +24,34 @@ GROQ_MODEL_CLEANSE = "gemma2-9b-it"
 GROQ_MODEL = "llama-3.3-70b-versatile"
 OPENROUTER_MODEL = "meta-llama/llama-3.1-70b-instruct"
 
+# Overridable so the pipeline can run against mock_llm.py or another compatible endpoint.
+GROQ_URL = os.getenv("GROQ_URL", "https://api.groq.com/openai/v1/chat/completions")
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Concurrency / rate limiting. Headers from the provider refine these at runtime.
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", "1"))
+GROQ_RPM = int(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = int(os.getenv("GROQ_TPM", "12000"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+
+# Windowed segmentation: chapters over the budget are split at paragraph
+# boundaries and segmented in parallel, with a few paragraphs of overlap.
+WINDOW_TOKENS = int(os.getenv("SEGMENT_WINDOW_TOKENS", "1500"))
+WINDOW_OVERLAP = int(os.getenv("SEGMENT_WINDOW_OVERLAP", "1"))
+STITCH_SLACK = 2      # unmatched rows (e.g. an added "X speaks.") allowed before a window's overlap
+
+# Resolve plain narration and clearly tagged quotes locally; only the rest goes to the LLM.
+PRESEGMENT = os.getenv("PRESEGMENT", "1") != "0"
+
+# Clean chapters with the local normalizer; only low-confidence ones get the LLM cleanse.
+LOCAL_CLEANSE = os.getenv("LOCAL_CLEANSE", "1") != "0"
+
+# Align the script against the chapter and re-request only dropped spans.
+VERIFY_COVERAGE = os.getenv("VERIFY_COVERAGE", "1") != "0"
+
+# Stream completions (SSE) and append finished rows to LLM_output/chapter_N.part as they arrive.
+SEGMENT_STREAM = os.getenv("SEGMENT_STREAM", "0") == "1"
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(message)s',
@@ -136,9 +172,87 @@ Rules:
 
 """
 
+def _feed_lines(text, on_row):
+    for line in text.split("\n"):
+        if line.strip():
+            on_row(line)
+
+def consume_stream(response, on_row):
+    """Read an OpenAI-style SSE stream, handing each completed line to `on_row`.
+
+    Returns (content, complete). `complete` is False when the stream ended
+    without [DONE] or a finish_reason; every row that was completed before
+    the cut has still been delivered.
+    """
+    response.encoding = "utf-8"
+    content = []
+    buffer = ""
+    complete = False
+    for raw in response.iter_lines(decode_unicode=True):
+        if not raw or not raw.startswith("data:"):
+            continue
+        payload = raw[5:].strip()
+        if payload == "[DONE]":
+            complete = True
+            break
+        choices = json.loads(payload).get("choices") or []
+        if choices and choices[0].get("finish_reason"):
+            complete = True
+        delta = choices[0].get("delta", {}).get("content") if choices else None
+        if not delta:
+            continue
+        content.append(delta)
+        buffer += delta
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            if line.strip():
+                on_row(line)
+    if buffer.strip():
+        on_row(buffer)
+    return "".join(content), complete
+
+def post_chat(url, headers, data, on_row=None):
+    """POST a chat completion through the shared rate limiter.
+
+    Goes through the pooled http_client, which retries 429/5xx and timeouts
+    with jittered backoff; a 429 pauses every worker on the same quota.
+    Successful responses are cached by content hash, so unchanged inputs
+    are never paid for twice. With `on_row` the completion is streamed and
+    each output line is delivered as soon as it is complete; a stream cut
+    before [DONE] raises ConnectionError once its complete rows are out.
+    """
+    cache = get_cache()
+    key = chat_key(url, data)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            if on_row is not None:
+                _feed_lines(cached, on_row)
+            return cached
+
+    payload = data if on_row is None else dict(data, stream=True)
+
+    limiter = limiter_for(data["model"], GROQ_RPM, GROQ_TPM)
+    prompt = "".join(m["content"] for m in data["messages"])
+    # Segmentation output is about as long as its input, so charge for both.
+    cost = estimate_tokens(prompt) + estimate_tokens(data["messages"][-1]["content"])
+
+    r = http_client.post(url, headers=headers, json=payload, timeout=60, stream=on_row is not None,
+                         max_retries=MAX_RETRIES, limiter=limiter, cost=cost)
+    r.raise_for_status()
+    if on_row is None:
+        content = r.json()["choices"][0]["message"]["content"]
+    else:
+        content, complete = consume_stream(r, on_row)
+        if not complete:
+            # Never cached or saved: the rows delivered so far stay in the .part file.
+            raise ConnectionError(f"stream ended without [DONE] after {len(content)} chars")
+    if cache is not None:
+        cache.put(key, content)
+    return content
+
 def call_groq_clense(chapter_text):
-    """Call GROQ API for segmentation."""
-    url = "https://api.groq.com/openai/v1/chat/completions"
+    """Call GROQ API to clean up the raw chapter text."""
     headers = {"Authorization": f"Bearer {GROQ_API_KEY}"}
     data = {
         "model": GROQ_MODEL_CLEANSE,
@@ -148,13 +262,10 @@ def call_groq_clense(chapter_text):
         ],
         "temperature": 0
     }
-    r = requests.post(url, headers=headers, json=data, timeout=60)
-    r.raise_for_status()
-    return r.json()["choices"][0]["message"]["content"]
+    return post_chat(GROQ_URL, headers, data)
 
-def call_groq(chapter_text):
-    """Call GROQ API for segmentation."""
-    url = "https://api.groq.com/openai/v1/chat/completions"
+def call_groq(chapter_text, on_row=None):
+    """Call GROQ API for segmentation; rows come back with real tabs (see tsv_row)."""
     headers = {"Authorization": f"Bearer {GROQ_API_KEY}"}
     data = {
         "model": GROQ_MODEL,
@@ -164,13 +275,13 @@ def call_groq(chapter_text):
         ],
         "temperature": 0
     }
-    r = requests.post(url, headers=headers, json=data, timeout=60)
-    r.raise_for_status()
-    return r.json()["choices"][0]["message"]["content"]
+    if on_row is not None:
+        deliver = on_row
+        on_row = lambda line: deliver(tsv_row(line))
+    return tsv_text(post_chat(GROQ_URL, headers, data, on_row=on_row))
 
 def call_openrouter(chapter_text):
     """Fallback to OpenRouter."""
-    url = "https://openrouter.ai/api/v1/chat/completions"
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "HTTP-Referer": "https://github.com/",
@@ -184,9 +295,145 @@ def call_openrouter(chapter_text):
         ],
         "temperature": 0
     }
-    r = requests.post(url, headers=headers, json=data, timeout=60)
-    r.raise_for_status()
-    return r.json()["choices"][0]["message"]["content"]
+    return post_chat(OPENROUTER_URL, headers, data)
+
+def _paragraphs(text, budget):
+    """Paragraphs of `text`, with any paragraph over budget split at sentence ends."""
+    out = []
+    for para in text.split("\n"):
+        if not para.strip():
+            continue
+        if estimate_tokens(para) <= budget:
+            out.append(para)
+            continue
+        sentences = re.split(r"(?<=[.!?”\"])\s+", para)
+        current = ""
+        for sentence in sentences:
+            if current and estimate_tokens(current + " " + sentence) > budget:
+                out.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            out.append(current)
+    return out
+
+def split_windows(text, budget=WINDOW_TOKENS, overlap=WINDOW_OVERLAP):
+    """Split a chapter into token-budgeted windows at paragraph boundaries.
+
+    Returns (window text, overlap paragraphs) pairs. Every window after the
+    first starts with the last `overlap` paragraphs of the previous one so
+    the model sees who was speaking; stitch_windows drops their rows again.
+    """
+    if budget <= 0 or estimate_tokens(text) <= budget:
+        return [(text, [])]
+
+    windows = []
+    current, size, fresh = [], 0, 0
+    for para in _paragraphs(text, budget):
+        cost = estimate_tokens(para)
+        if fresh and size + cost > budget:
+            windows.append((current, len(current) - fresh))
+            current = current[-overlap:] if overlap else []
+            size = sum(estimate_tokens(p) for p in current)
+            fresh = 0
+        current.append(para)
+        size += cost
+        fresh += 1
+    if fresh:
+        windows.append((current, len(current) - fresh))
+    return [("\n".join(w), w[:repeated]) for w, repeated in windows]
+
+def _text_key(text):
+    """Compare text ignoring case, spacing and punctuation."""
+    return re.sub(r"[\W_]+", "", text.lower())
+
+def _drop_overlap(lines, overlap):
+    """`lines` without the leading rows that voice the `overlap` paragraphs.
+
+    Rows must spell out the whole overlap text in order, so short or
+    repeated lines ("Yes.") after it survive, and up to STITCH_SLACK rows the
+    model adds before it (an intro like "X speaks.") go with it. If the rows
+    never cover the overlap, nothing is dropped.
+    """
+    target = _text_key(" ".join(overlap))
+    pos, cut = 0, 0
+    for i, line in enumerate(lines):
+        if pos >= len(target) or (not cut and i > STITCH_SLACK):
+            break
+        key = _text_key(line.split("\t")[-1])
+        if not key:
+            continue
+        if not target.startswith(key, pos):
+            if cut:
+                break
+            continue
+        pos, cut = pos + len(key), i + 1
+    return lines[cut:] if pos >= len(target) else lines
+
+def stitch_windows(outputs, overlaps):
+    """Join per-window TSV, dropping each window's rows for its overlap paragraphs."""
+    rows = []
+    for output, overlap in zip(outputs, overlaps):
+        lines = [line for line in output.strip().split("\n") if line.strip()]
+        rows.extend(_drop_overlap(lines, overlap) if overlap else lines)
+    return "\n".join(rows)
+
+def segment_text(text, on_row=None):
+    """Segment text with the LLM, windowing it when it is too long for one call.
+
+    A single window streams its rows to `on_row`; windowed text delivers
+    its rows once the windows have been stitched.
+    """
+    windows = split_windows(text)
+    if len(windows) == 1:
+        return call_groq(text, on_row=on_row)
+
+    logging.info(f"Segmenting in {len(windows)} windows")
+    texts, overlaps = zip(*windows)
+    with ThreadPoolExecutor(max_workers=len(windows)) as pool:
+        outputs = list(pool.map(call_groq, texts))
+    stitched = stitch_windows(outputs, overlaps)
+    if on_row is not None:
+        _feed_lines(stitched, on_row)
+    return stitched
+
+@lru_cache(maxsize=1)
+def get_presegmenter():
+    return PreSegmenter(load_cast(OUTPUT_DIR))
+
+def segment_chapter(chapter_text, on_row=None):
+    """Segment a (cleansed) chapter; the LLM only sees spans the pre-segmenter could not resolve.
+
+    `on_row` receives the final rows in chapter order as soon as they can
+    no longer change; the completion is only streamed when it is given.
+    """
+    if not PRESEGMENT:
+        return segment_text(chapter_text, on_row=on_row)
+
+    paragraphs = get_presegmenter().segment(chapter_text)
+    text, included = llm_input(paragraphs)
+    local = sum(1 for p in paragraphs if p.local)
+    logging.info(f"Pre-segmented {local}/{len(paragraphs)} paragraphs locally")
+
+    renderer = Renderer()
+    splicer = Splicer(paragraphs, included)
+    rows = []
+
+    def emit(finished):
+        for para in finished:
+            for row in renderer.rows(para):
+                rows.append(row)
+                if on_row is not None:
+                    on_row(row)
+
+    emit(splicer.ready())
+    if included and on_row is not None:
+        segment_text(text, on_row=lambda line: emit(splicer.feed(line)))
+    elif included:
+        _feed_lines(segment_text(text), lambda line: emit(splicer.feed(line)))
+    emit(splicer.finish())
+    return "\n".join(rows)
 
 def parse_llm_output(raw_output):
     """Try to parse the LLM's JSON output."""
@@ -199,10 +446,61 @@ def parse_llm_output(raw_output):
             return json.loads(match.group(0))
         raise
 
+def cleanse_chapter(chapter_text):
+    """Normalize locally; fall back to the LLM cleanse only when the normalizer is unsure."""
+    if not LOCAL_CLEANSE:
+        return call_groq_clense(chapter_text)
+    normalized, issues = normalize(chapter_text)
+    if not issues:
+        return normalized
+    logging.info(f"Low-confidence normalization ({'; '.join(issues)}), using LLM cleanse")
+    return call_groq_clense(normalized)
+
+def process_chapter(chapter_file):
+    """Cleanse + segment one chapter and write it to OUTPUT_DIR."""
+    chapter_num = re.search(r"\d+", chapter_file).group()
+    output_file = os.path.join(OUTPUT_DIR, f"chapter_{chapter_num}.txt")
+
+    print(f"Processing chapter {chapter_num}...",flush=True)
+    logging.info(f"Processing chapter {chapter_num}")
+
+    with open(os.path.join(CHAPTERS_DIR, chapter_file), "r", encoding="utf-8") as f:
+        chapter_text = f.read().strip()
+
+    cleansed_data = cleanse_chapter(chapter_text)
+    if SEGMENT_STREAM:
+        # Rows land in the .part file as they stream; a cut-off chapter keeps them.
+        part_file = os.path.join(OUTPUT_DIR, f"chapter_{chapter_num}.part")
+        with open(part_file, "w", encoding="utf-8") as part:
+            def on_row(row):
+                part.write(row + "\n")
+                part.flush()
+            raw_output = segment_chapter(cleansed_data, on_row=on_row)
+    else:
+        part_file = None
+        raw_output = segment_chapter(cleansed_data)
+
+    if VERIFY_COVERAGE:
+        raw_output, gaps = repair(cleansed_data, raw_output, segment_chapter)
+        for gap in gaps:
+            logging.info(f"⚠ Chapter {chapter_num}: {gap.kind} span repaired: {gap.text[:80]!r}")
+    print(f"output {raw_output}",flush=True)
+
+    parsed_json = raw_output
+    # parsed_json = parse_llm_output(raw_output)
+    logging.info(parsed_json)
+
+    print(f"Printing....",flush=True)
+    logging.info("Printing....")
+    write_script(output_file, parse_tsv(parsed_json))
+    if part_file:
+        os.remove(part_file)
+
+    print(f"Saved {output_file}")
+    return output_file
+
 def main():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    if not os.path.exists(OUTPUT_DIR):
-      os.makedirs(OUTPUT_DIR)
     logging.info(f"api key  {GROQ_API_KEY}")
     chapter_arg = sys.argv[1] if len(sys.argv) > 1 else ""
     
@@ -210,58 +508,34 @@ def main():
         [f for f in os.listdir(CHAPTERS_DIR) if f.startswith("chapter_") and f.endswith(".txt")],
         key=lambda x: int(re.search(r"\d+", x).group())
     )
-    
+
+    pending = []
     for chapter_file in chapter_files:
         chapter_num = re.search(r"\d+", chapter_file).group()
         if chapter_arg and chapter_num != str(chapter_arg):
             continue
         output_file = os.path.join(OUTPUT_DIR, f"chapter_{chapter_num}.txt")
-        logging.info(chapter_num)
         if os.path.exists(output_file):
             print(f"Skipping chapter {chapter_num} (already processed).",flush=True)
             continue
-
-        print(f"Processing chapter {chapter_num}...",flush=True)
-        logging.info(f"Processing chapter {chapter_num}")
-
-        with open(os.path.join(CHAPTERS_DIR, chapter_file), "r", encoding="utf-8") as f:
-            chapter_text = f.read().strip()
-
-        try:
-            cleansed_data = call_groq_clense(chapter_text)
-            raw_output = call_groq(cleansed_data)
-            print(f"output {raw_output}",flush=True)
-        except Exception as e:
-            error_str = str(e).lower()
-            if  "429" in error_str or "rate limit" in error_str:
-                logging.info("⚠ Rate limit hit. Waiting 60 seconds...")
-                time.sleep(60)
-                raw_output = call_groq(chapter_text)
-            elif "503" in error_str or "timeout" in error_str:
-                logging.info("⚠ Service busy or timed out. Waiting 30 seconds...")
-                time.sleep(30)
-                raw_output = call_groq(chapter_text)
-            # print(f"GROQ failed for chapter {chapter_num}: {e}, trying OpenRouter...",flush=True)
-            # logging.info("GROQ failed")
-            # raw_output = call_openrouter(chapter_text)
-
-        try:
-            parsed_json = raw_output
-            # parsed_json = parse_llm_output(raw_output)
-            # print(f"output1 {parsed_json}",flush=True)
-            logging.info(parsed_json)
-        except Exception as e:
-            print(f"Failed to parse LLM output for chapter {chapter_num}: {e}",flush=True)
-            logging.info("Failed to parse LLM")
-            logging.info(raw_output)
-            continue
-
-        with open(output_file, "w", encoding="utf-8") as f:
-            print(f"Printing....",flush=True)
-            logging.info("Printing....")
-            json.dump(parsed_json, f, ensure_ascii=False, indent=2)
-
-        print(f"Saved {output_file}")
+        pending.append(chapter_file)
+
+    logging.info(f"{len(pending)} chapters pending, {SEGMENT_WORKERS} in flight")
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, SEGMENT_WORKERS)) as pool:
+        futures = {pool.submit(process_chapter, f): f for f in pending}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"❌ Failed {futures[future]}: {e}",flush=True)
+                failed.append(futures[future])
+
+    if failed:
+        logging.info(f"{len(failed)} chapters failed: {', '.join(sorted(failed))}")
+    if get_cache() is not None:
+        logging.info(get_cache().summary())
+    logging.info(f"HTTP: {http_client.metrics_summary()}")
 
 if __name__ == "__main__":
     try:
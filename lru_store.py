@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import threading
+import time
+
+EVICT_BATCH = 64
+
+
+class LRUStore:
+    """SQLite key -> value store with size-bounded LRU eviction.
+
+    Subclasses pick the table and the value column type. `size` and `last_used`
+    come before the value in each row and `last_used` is indexed, so the
+    bookkeeping never reads a payload's overflow pages; the byte total is
+    kept in a meta row instead of being summed on every write.
+    """
+
+    table = "entries"
+    value_type = "BLOB"
+    label = "Cache"
+    noun = "entries"
+
+    def __init__(self, path, max_bytes):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        t = self.table
+        with self.conn:
+            self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {t} (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER DEFAULT 0,
+                value {self.value_type}
+            )
+            """)
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {t}_lru ON {t} (last_used)")
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {t}_meta (name TEXT PRIMARY KEY, value INTEGER)")
+            self.conn.execute(
+                f"INSERT OR IGNORE INTO {t}_meta (name, value) "
+                f"VALUES ('bytes', (SELECT COALESCE(SUM(size), 0) FROM {t}))"
+            )
+
+    def _total(self):
+        return self.conn.execute(f"SELECT value FROM {self.table}_meta WHERE name = 'bytes'").fetchone()[0]
+
+    def _get(self, key):
+        with self.lock:
+            row = self.conn.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self.conn:
+                self.conn.execute(
+                    f"UPDATE {self.table} SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                    (time.time(), key),
+                )
+            return row[0]
+
+    def _put(self, key, value, size):
+        t = self.table
+        with self.lock, self.conn:
+            old = self.conn.execute(f"SELECT size FROM {t} WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {t} (key, size, last_used, value) VALUES (?, ?, ?, ?)",
+                (key, size, time.time(), value),
+            )
+            self.conn.execute(f"UPDATE {t}_meta SET value = value + ? WHERE name = 'bytes'",
+                              (size - (old[0] if old else 0),))
+            self._evict()
+
+    def _evict(self):
+        """Drop least-recently-used entries until the store fits its budget."""
+        t = self.table
+        total = self._total()
+        while total > self.max_bytes:
+            rows = self.conn.execute(
+                f"SELECT key, size FROM {t} ORDER BY last_used LIMIT ?", (EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            dropped = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                dropped.append((key,))
+                total -= size
+            self.conn.executemany(f"DELETE FROM {t} WHERE key = ?", dropped)
+            self.conn.execute(f"UPDATE {t}_meta SET value = ? WHERE name = 'bytes'", (total,))
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            total = self._total()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total,
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (
+            f"{self.label}: {s['hits']} hits / {s['misses']} misses "
+            f"({s['hit_rate']:.0%}), {s['entries']} {self.noun}, {s['bytes'] / 1e6:.1f} MB"
+        )
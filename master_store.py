@@ -0,0 +1,105 @@
+import json
+import os
+
+# === CONFIG ===
+MASTER_FILE = "master_characters.json"
+COMPACT_EVERY = int(os.getenv("MASTER_COMPACT_EVERY", "50"))  # journal entries between snapshots
+
+
+def journal_path(path):
+    return os.path.splitext(path)[0] + ".journal"
+
+
+def write_atomic(path, data):
+    """Write JSON to a temp file, fsync it and rename it over `path`."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class MasterStore:
+    """master_characters.json as a snapshot plus an append-only journal.
+
+    Each new character (or batch of screened names) is one JSON line in
+    master_characters.journal, so a per-chapter write costs the same
+    however big the cast gets. Every COMPACT_EVERY entries the journal is
+    folded into the snapshot, which is replaced atomically. A crash can
+    lose at most the last, half-written journal line; it can never
+    truncate the snapshot.
+    """
+
+    def __init__(self, path=MASTER_FILE, compact_every=COMPACT_EVERY):
+        self.path = path
+        self.journal = journal_path(path)
+        self.compact_every = compact_every
+        self.pending = 0
+        self.data = self._load()
+
+    def _load(self):
+        data = {"characters": {}}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                try:
+                    data = json.load(f)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{self.path} is not valid JSON ({e}); refusing to start from empty") from e
+            if not isinstance(data.get("characters"), dict):
+                raise ValueError(f"{self.path} has no 'characters' object; refusing to start from empty")
+
+        if os.path.exists(self.journal):
+            good = 0
+            with open(self.journal, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b"\n"):
+                        break
+                    self._apply(data, entry)
+                    self.pending += 1
+                    good += len(line)
+            if good != os.path.getsize(self.journal):
+                # Drop a torn final write so new entries start on a clean line.
+                with open(self.journal, "r+b") as f:
+                    f.truncate(good)
+        return data
+
+    @staticmethod
+    def _apply(data, entry):
+        if entry["op"] == "character":
+            data["characters"].setdefault(entry["name"], entry["value"])
+        elif entry["op"] == "screened":
+            screened = data.setdefault("screened", [])
+            screened.extend(n for n in entry["names"] if n not in screened)
+
+    def _append(self, entry):
+        self._apply(self.data, entry)
+        with open(self.journal, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.pending += 1
+        if self.pending >= self.compact_every:
+            self.compact()
+
+    def add_character(self, name, value):
+        """Record a new character; an existing name keeps its first description."""
+        if name not in self.data["characters"]:
+            self._append({"op": "character", "name": name, "value": value})
+
+    def add_screened(self, names):
+        screened = set(self.data.get("screened", []))
+        names = [n for n in names if n not in screened and n not in self.data["characters"]]
+        if names:
+            self._append({"op": "screened", "names": names})
+
+    def compact(self):
+        """Fold the journal into the snapshot (atomic rename), then start a new journal."""
+        write_atomic(self.path, self.data)
+        if os.path.exists(self.journal):
+            os.remove(self.journal)
+        self.pending = 0
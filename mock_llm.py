@@ -0,0 +1,204 @@
+import argparse
+import ast
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from presegment import QUOTE_RE
+from rate_limit import estimate_tokens
+
+# === CONFIG ===
+DEFAULT_PORT = 8787
+STREAM_CHUNK_CHARS = 48
+
+NAME_RE = re.compile(r"\b([A-Z][a-z]+(?: [A-Z][a-z]+)?)\b")
+CANDIDATES_RE = re.compile(r"Only describe these names[^:]*: (\[.*\])")
+
+
+def _speaker(narration):
+    """Deterministic speaker for a quote: the last capitalised name in nearby narration."""
+    names = NAME_RE.findall(narration)
+    return names[-1] if names else "unknown"
+
+
+def _gender(name):
+    if name == "unknown":
+        return "unknown"
+    return "male" if hashlib.sha1(name.encode("utf-8")).digest()[0] % 2 else "female"
+
+
+def fake_script(text):
+    """TSV rows covering every word of `text`: narration around quotes, one row per quote."""
+    rows = []
+    for para in text.split("\n"):
+        para = para.strip()
+        if not para:
+            continue
+        quotes = list(QUOTE_RE.finditer(para))
+        speaker = _speaker(QUOTE_RE.sub(" ", para))
+        pos = 0
+        for m in quotes:
+            before = para[pos:m.start()].strip()
+            if before:
+                rows.append(f"narrator\tunknown\tneutral\t{before}")
+            rows.append(f"{speaker}\t{_gender(speaker)}\tneutral\t{m.group()}")
+            pos = m.end()
+        after = para[pos:].strip()
+        if after:
+            rows.append(f"narrator\tunknown\tneutral\t{after}")
+    return "\n".join(rows)
+
+
+def fake_characters(prompt):
+    """Character JSON for every other candidate name in a character_json prompt."""
+    match = CANDIDATES_RE.search(prompt)
+    names = ast.literal_eval(match.group(1)) if match else []
+    characters = [
+        {"name": name, "gender": _gender(name), "age_range": "adult", "body_build": "average",
+         "face_shape": "oval", "eyes": "dark", "hair": "black", "clothing": "robe",
+         "signature_item": "none"}
+        for i, name in enumerate(names) if i % 2 == 0
+    ]
+    return json.dumps({"characters": characters})
+
+
+def fake_completion(messages):
+    """Segmentation prompts get a script and character prompts get JSON;
+    anything else (the cleanse pass) is echoed back."""
+    system = " ".join(m["content"] for m in messages if m["role"] == "system")
+    user = messages[-1]["content"]
+    if "tab-separated" in system:
+        return fake_script(user)
+    if '"characters"' in user:
+        return fake_characters(user)
+    return user
+
+
+class MockState:
+    """Server knobs plus counters, shared by the handler threads."""
+
+    def __init__(self, latency=0.2, tokens_per_sec=400.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+
+    def should_throttle(self):
+        with self.lock:
+            self.requests += 1
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.throttled += 1
+                return True
+            return False
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "throttled": self.throttled}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.state.stats())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": "not found"})
+            return
+        if self.state.should_throttle():
+            self._send_json(429, {"error": {"message": "Rate limit reached (mock)"}},
+                            {"retry-after": "1"})
+            return
+
+        content = fake_completion(data["messages"])
+        time.sleep(self.state.latency)
+        per_char = 1 / (self.state.tokens_per_sec * 4) if self.state.tokens_per_sec else 0
+        if data.get("stream"):
+            self._stream(data["model"], content, per_char)
+            return
+        time.sleep(len(content) * per_char)
+        self._send_json(200, {
+            "id": "mock",
+            "object": "chat.completion",
+            "model": data["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"completion_tokens": estimate_tokens(content)},
+        })
+
+    def _stream(self, model, content, per_char):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i in range(0, len(content), STREAM_CHUNK_CHARS):
+            piece = content[i:i + STREAM_CHUNK_CHARS]
+            time.sleep(len(piece) * per_char)
+            chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": piece}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+def start_server(port=0, **knobs):
+    """Run the mock in a background thread; returns (server, base_url).
+
+    `knobs` go to MockState: latency (s before the first token),
+    tokens_per_sec (output pacing, 0 = instant), error_rate (share of
+    requests answered with 429) and seed.
+    """
+    handler = type("Handler", (MockHandler,), {"state": MockState(**knobs)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in for Groq/OpenRouter")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tps", type=float, default=400.0, help="output tokens per second (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server, url = start_server(args.port, latency=args.latency, tokens_per_sec=args.tps,
+                               error_rate=args.error_rate, seed=args.seed)
+    print(f"🧪 Mock LLM listening on {url}")
+    print(f"   GROQ_URL={url} OPENROUTER_URL={url} python llm_segment.py")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
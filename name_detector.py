@@ -0,0 +1,122 @@
+import glob
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+
+from presegment import NOT_NAMES
+from script_store import ScriptReader
+
+# === CONFIG ===
+CHAPTERS_DIR = "chapters"
+OUTPUT_DIR = "LLM_output"
+COMMON_MIN_CHAPTERS = 3   # a word written in lower case in this many chapters is not a name
+MIN_MENTIONS = 2          # a bare capitalised run must recur to count as a name
+MAX_EXCERPT_CHARS = 6000  # paragraphs sent to the LLM per chapter
+
+LOWER_RE = re.compile(r"\b[a-z]+\b")
+RUN_RE = re.compile(r"[A-Z][a-z]+(?: [A-Z][a-z]+)*")
+HONORIFIC_RE = re.compile(
+    r"\b(?:Mr|Mrs|Ms|Dr)\.? ([A-Z][a-z]+)"
+    r"|\b(?:Miss|Young Master|Young Miss|Elder|Brother|Sister|Uncle|Aunt|Grandpa|Grandma"
+    r"|Old|Little|Lord|Lady|Patriarch|Sect Master|Master|Boss) ([A-Z][a-z]+(?: [A-Z][a-z]+)?)"
+)
+
+# Capitalised words that are never names, however rarely they appear in lower case.
+STOPWORDS = {
+    "i", "mr", "mrs", "ms", "dr", "miss", "young", "master", "elder", "brother", "sister",
+    "uncle", "aunt", "grandpa", "grandma", "old", "little", "lord", "lady", "patriarch",
+    "sect", "boss", "god", "heaven", "heavens", "oh", "ah", "hmph", "haha", "okay", "ok",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+    "january", "february", "march", "april", "may", "june", "july", "august",
+    "september", "october", "november", "december", "chapter",
+}
+
+
+@lru_cache(maxsize=1)
+def common_words(chapters_dir=CHAPTERS_DIR, min_chapters=COMMON_MIN_CHAPTERS):
+    """Words the corpus writes in lower case often enough that they are never names."""
+    counts = Counter()
+    for path in glob.glob(os.path.join(chapters_dir, "chapter_*.txt")):
+        with open(path, "r", encoding="utf-8") as f:
+            counts.update(set(LOWER_RE.findall(f.read())))
+    return frozenset(w for w, n in counts.items() if n >= min_chapters)
+
+
+def chapter_speakers(chapter_num, output_dir=OUTPUT_DIR):
+    """Speakers the segmenter already found in this chapter, if it has been segmented."""
+    path = os.path.join(output_dir, f"chapter_{chapter_num}.txt")
+    if not os.path.exists(path):
+        return set()
+    return {seg.speaker for seg in ScriptReader(path)
+            if seg.speaker.lower() not in NOT_NAMES and seg.speaker[:1].isupper()}
+
+
+class NameDetector:
+    """Finds character-name candidates in a chapter without calling the LLM.
+
+    Candidates are runs of capitalised words that are not `common` words
+    (so "Seeing" or "Dragon" at a sentence start do not count), names
+    after honorifics ("Mr. Su", "Elder Zhao") and speakers from
+    LLM_output. `known` names, and any of their single words, count as
+    already seen. Without `common`, the chapter's own lower-case words
+    are used.
+    """
+
+    def __init__(self, known=(), common=None, min_mentions=MIN_MENTIONS):
+        self.known = {n.lower() for n in known}
+        self.known_words = {w for n in self.known for w in n.split()}
+        self.common = common
+        self.min_mentions = min_mentions
+
+    def candidates(self, text, speakers=()):
+        """Candidate name -> mention count."""
+        common = (self.common or set(LOWER_RE.findall(text))) | STOPWORDS
+        counts = Counter()
+        for m in RUN_RE.finditer(text):
+            name = []
+            for word in m.group().split():
+                if word.lower() in common:
+                    if name:
+                        counts[" ".join(name)] += 1
+                    name = []
+                else:
+                    name.append(word)
+            if name:
+                counts[" ".join(name)] += 1
+
+        found = {name: n for name, n in counts.items() if n >= self.min_mentions}
+        for m in HONORIFIC_RE.finditer(text):
+            name = m.group(1) or m.group(2)
+            if name.split()[0].lower() not in common:
+                found[name] = max(found.get(name, 0), counts.get(name, 1))
+        for name in speakers:
+            found[name] = max(found.get(name, 0), counts.get(name, 1))
+
+        # "Su" on its own is just the short form of "Su Wenzong".
+        long_words = {w for name in found if " " in name for w in name.split()}
+        return {name: n for name, n in found.items() if " " in name or name not in long_words}
+
+    def is_known(self, name):
+        key = name.lower()
+        return key in self.known or (" " not in key and key in self.known_words)
+
+    def unseen(self, text, speakers=()):
+        """Candidates not covered by `known`, most mentioned first."""
+        found = self.candidates(text, speakers)
+        names = [name for name in found if not self.is_known(name)]
+        return sorted(names, key=lambda name: (-found[name], name))
+
+
+def excerpt(text, names, max_chars=MAX_EXCERPT_CHARS):
+    """The paragraphs that mention any of `names`, in chapter order, within the budget."""
+    patterns = [re.compile(rf"\b{re.escape(name)}\b") for name in names]
+    picked, size = [], 0
+    for para in text.split("\n"):
+        if not para.strip() or not any(p.search(para) for p in patterns):
+            continue
+        if picked and size + len(para) > max_chars:
+            break
+        picked.append(para)
+        size += len(para) + 1
+    return "\n".join(picked)
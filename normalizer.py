@@ -0,0 +1,167 @@
+import glob
+import json
+import os
+import re
+import sys
+import unicodedata
+from collections import Counter
+
+# === CONFIG ===
+CHAPTERS_DIR = "chapters"
+CENSOR_MAP_FILE = "censor_map.json"
+
+# One-pass character mapping for what PROMPT_STORY_CORRECTIONS asks the LLM to do.
+_CHAR_MAP = {
+    "“": '"', "”": '"', "„": '"', "‟": '"',   # curly double quotes
+    "‘": "'", "’": "'", "‚": "'", "‛": "'",   # curly single quotes
+    "—": "--", "―": "--", "–": "-", "‒": "-",  # dashes
+    "\u00a0": " ", "\u2009": " ", "\u202f": " ", "\u3000": " ",   # odd spaces
+    "\u200b": None, "\u200c": None, "\u200d": None, "\ufeff": None,  # zero-width
+    "\ufffd": None,                                         # replacement char
+    "\t": " ", "\r": None,
+    "？": "?", "！": "!", "，": ",", "、": ",", "：": ":", "；": ";",
+}
+# Other control characters and the decorative dingbats some sources use as watermarks.
+for _cp in list(range(0x00, 0x20)) + list(range(0x7f, 0xa0)):
+    if chr(_cp) != "\n":
+        _CHAR_MAP.setdefault(chr(_cp), None)
+for _cp in range(0x2700, 0x27c0):
+    _CHAR_MAP.setdefault(chr(_cp), None)
+TRANSLATION = str.maketrans(_CHAR_MAP)
+
+CENSORED_RE = re.compile(r"[A-Za-z]+(?:\*+[A-Za-z]+)+")
+WORD_RE = re.compile(r"[A-Za-z]+")
+CJK_RE = re.compile(r"[\u3400-\u9fff]")
+MOJIBAKE_RE = re.compile(r"â€|Ã[\x80-\xbf]")
+BROKEN_LINE_RE = re.compile(r"([a-z,])\n(?=[a-z])")
+SPACES_RE = re.compile(r"[ ]{2,}")
+
+
+# How the source site masks words: the masked fragment and what it hides.
+# Longer words are built from these ('cla*s' -> 'class', 'a*sa*sin' -> 'assassin').
+CENSOR_MASKS = {
+    "a*s": "ass",
+    "sh*t": "shit",
+    "f*ck": "fuck",
+    "f**k": "fuck",
+    "d*mn": "damn",
+    "b*tch": "bitch",
+    "p*ss": "piss",
+    "p*ssy": "pussy",
+    "p*ssies": "pussies",
+    "b*****d": "bastard",
+    "bast*rd": "bastard",
+    "c*nt": "cunt",
+    "c*ck": "cock",
+    "sl*t": "slut",
+    "wh*re": "whore",
+}
+
+
+def _unmask(token):
+    word = token.lower()
+    for mask in sorted(CENSOR_MASKS, key=len, reverse=True):
+        word = word.replace(mask, CENSOR_MASKS[mask])
+    return word
+
+
+def learn_censor_map(chapters_dir=CHAPTERS_DIR, min_count=3):
+    """Map every censored token in the corpus (e.g. 'embarra*sed') to its word.
+
+    Tokens are first unmasked with CENSOR_MASKS; anything left over is
+    matched against uncensored words of the same shape elsewhere in the
+    corpus, taking the most frequent one seen at least `min_count` times.
+    """
+    vocab = Counter()
+    censored = set()
+    for path in glob.glob(os.path.join(chapters_dir, "chapter_*.txt")):
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        censored.update(w.lower() for w in CENSORED_RE.findall(text))
+        vocab.update(w.lower() for w in WORD_RE.findall(text))
+
+    by_length = {}
+    for word, count in vocab.items():
+        if count >= min_count:
+            by_length.setdefault(len(word), []).append((count, word))
+
+    mapping = {}
+    for token in sorted(censored):
+        word = _unmask(token)
+        if "*" not in word:
+            mapping[token] = word
+            continue
+        shape = re.compile("^" + re.escape(token).replace(r"\*", "[a-z]") + "$")
+        candidates = [(c, w) for c, w in by_length.get(len(token), []) if shape.match(w)]
+        if candidates:
+            mapping[token] = max(candidates)[1]
+    return mapping
+
+
+def load_censor_map(path=CENSOR_MAP_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+CENSOR_MAP = load_censor_map()
+
+
+def _match_case(template, word):
+    if template.isupper() and len(template) > 1:
+        return word.upper()
+    if template[:1].isupper():
+        return word[:1].upper() + word[1:]
+    return word
+
+
+def normalize(text, censor_map=None):
+    """Locally clean a raw chapter.
+
+    Returns (clean_text, issues). `issues` is empty when the result can be
+    trusted; otherwise it lists why the chapter should still get the LLM
+    cleanse (untranslated CJK, mojibake, lost characters, unknown censoring).
+    """
+    censor_map = CENSOR_MAP if censor_map is None else censor_map
+    issues = []
+    if "\ufffd" in text:
+        issues.append("replacement characters")
+    if MOJIBAKE_RE.search(text):
+        issues.append("mojibake")
+
+    text = unicodedata.normalize("NFC", text).translate(TRANSLATION)
+
+    unknown = set()
+
+    def restore(m):
+        token = m.group(0)
+        word = censor_map.get(token.lower())
+        if word is None:
+            unknown.add(token)
+            return token
+        return _match_case(token, word)
+
+    text = CENSORED_RE.sub(restore, text)
+    if unknown:
+        issues.append("unknown censored words: " + ", ".join(sorted(unknown)))
+    if CJK_RE.search(text):
+        issues.append("CJK characters")
+
+    text = BROKEN_LINE_RE.sub(r"\1 ", text)
+    lines = [SPACES_RE.sub(" ", line).strip() for line in text.split("\n")]
+    text = "\n".join(line for line in lines if line)
+    return text, issues
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--learn":
+        mapping = learn_censor_map()
+        with open(CENSOR_MAP_FILE, "w", encoding="utf-8") as f:
+            json.dump(mapping, f, indent=2, ensure_ascii=False, sort_keys=True)
+        print(f"📌 Learned {len(mapping)} censored words -> {CENSOR_MAP_FILE}")
+    else:
+        for path in sys.argv[1:]:
+            with open(path, "r", encoding="utf-8") as f:
+                cleaned, problems = normalize(f.read())
+            print(f"{path}: {'; '.join(problems) or 'ok'}")
@@ -0,0 +1,308 @@
+import glob
+import os
+import re
+import sqlite3
+from collections import Counter, defaultdict
+
+from master_store import MasterStore
+from script_store import ScriptReader
+
+# === CONFIG ===
+OUTPUT_DIR = "LLM_output"
+MASTER_FILE = "master_characters.json"
+DB_PATH = "voice.db"
+
+# SYSTEM_PROMPT rule 10 speech verbs (plus a few the corpus uses a lot),
+# mapped to the mood the LLM usually picks for them.
+SPEECH_VERBS = {
+    "said": "neutral",
+    "asked": "neutral",
+    "replied": "calm",
+    "answered": "calm",
+    "explained": "calm",
+    "questioned": "serious",
+    "shouted": "angry",
+    "yelled": "angry",
+    "roared": "angry",
+    "snapped": "angry",
+    "whispered": "calm",
+    "murmured": "calm",
+    "muttered": "nervous",
+    "scoffed": "mocking",
+    "sneered": "mocking",
+    "snorted": "mocking",
+    "exclaimed": "surprised",
+    "cried": "emotional",
+    "laughed": "joyful",
+}
+
+QUOTE_RE = re.compile(r"“[^“”]*”|\"[^\"]*\"")
+NOT_NAMES = {"narrator", "unknown"}
+MIN_MATCH_CHARS = 12  # shorter row keys ("yes", "no") only match the current paragraph, the start of the next one, or a whole paragraph
+EDGE_MATCH_CHARS = 24  # a row the LLM reworded can still match on its first or last this many characters
+
+
+def _norm(text):
+    return re.sub(r"[\W_]+", "", text.lower())
+
+
+def _row(speaker, gender, mood, text):
+    return f"{speaker}\t{gender}\t{mood}\t{text}"
+
+
+def load_cast(output_dir=OUTPUT_DIR, master_file=MASTER_FILE, db_path=DB_PATH):
+    """Known speaking characters -> gender, from segmented output, the master list and voice.db."""
+    genders = defaultdict(Counter)
+    for path in glob.glob(os.path.join(output_dir, "chapter_*.txt")):
+        try:
+            segments = list(ScriptReader(path))
+        except (ValueError, OSError):
+            continue
+        for seg in segments:
+            genders[seg.speaker][seg.gender] += 1
+
+    for name, c in MasterStore(master_file).data["characters"].items():
+        genders[name][c.get("gender", "unknown")] += 100
+
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            for name, gender in conn.execute("SELECT actor_name, gender FROM voice_assignments"):
+                genders[name][gender] += 100
+        except sqlite3.Error:
+            pass
+        conn.close()
+
+    cast = {}
+    for name, counts in genders.items():
+        if name.lower() in NOT_NAMES or not name[:1].isupper():
+            continue
+        cast[name] = counts.most_common(1)[0][0]
+    return cast
+
+
+class Paragraph:
+    """One source paragraph; `rows` is None until someone has segmented it."""
+    __slots__ = ("text", "rows", "local")
+
+    def __init__(self, text):
+        self.text = text
+        self.rows = None
+        self.local = False
+
+
+class PreSegmenter:
+    """Deterministically segments lines that need no judgement (SYSTEM_PROMPT rule 10a/b).
+
+    Plain narration paragraphs and quotes carrying a same-paragraph tag
+    (“...,” said Liu Mei / Chen Ping said, “...”) or a tag at the start of
+    the next paragraph (Su Wenzong said with a faint smile.) are resolved
+    locally. Anything else is left for the LLM.
+    """
+
+    def __init__(self, cast):
+        self.cast = cast
+        names = "|".join(re.escape(n) for n in sorted(cast, key=len, reverse=True)) or r"(?!x)x"
+        verbs = "|".join(SPEECH_VERBS)
+        # Greedy lead-in: the tag is the last name + verb before the colon,
+        # not an earlier one ("Seeing that Chen Ping said nothing, Su Yuqi snapped:").
+        self.pre_tag = re.compile(
+            rf"^.*\b(?P<name>{names})\s+(?:\w+ly\s+)?(?P<verb>{verbs})\b[^.!?“”\"]*[,:]\s*$"
+        )
+        self.post_tag = re.compile(
+            rf"^\W*(?:(?P<verb>{verbs})\s+(?P<name>{names})|(?P<name2>{names})\s+(?:\w+ly\s+)?(?P<verb2>{verbs}))\b"
+        )
+
+    def _tag(self, match):
+        if not match:
+            return None
+        name = match.group("name") or match.groupdict().get("name2")
+        verb = match.group("verb") or match.groupdict().get("verb2")
+        return name, SPEECH_VERBS[verb]
+
+    def segment(self, text):
+        paragraphs = [Paragraph(p.strip()) for p in text.split("\n") if p.strip()]
+        for i, para in enumerate(paragraphs):
+            following = paragraphs[i + 1].text if i + 1 < len(paragraphs) else ""
+            rows = self._resolve(para.text, following)
+            if rows is not None:
+                para.rows = rows
+                para.local = True
+        return paragraphs
+
+    def _resolve(self, text, following):
+        if text.count("“") != text.count("”") or text.count('"') % 2:
+            return None
+        quotes = list(QUOTE_RE.finditer(text))
+        if not quotes:
+            return [_row("narrator", "unknown", "neutral", text)]
+
+        # Split into alternating narration / quote pieces.
+        pieces = []
+        last = 0
+        for q in quotes:
+            if text[last:q.start()].strip():
+                pieces.append(("narration", text[last:q.start()].strip()))
+            pieces.append(("quote", q.group(0)))
+            last = q.end()
+        if text[last:].strip():
+            pieces.append(("narration", text[last:].strip()))
+
+        # Attribute each quote from the narration right before or after it.
+        tags = []
+        for k, (kind, piece) in enumerate(pieces):
+            if kind != "quote":
+                continue
+            tag = None
+            if k + 1 < len(pieces) and pieces[k + 1][0] == "narration":
+                tag = self._tag(self.post_tag.search(pieces[k + 1][1]))
+            if tag is None and k > 0 and pieces[k - 1][0] == "narration":
+                tag = self._tag(self.pre_tag.search(pieces[k - 1][1]))
+            tags.append(tag)
+
+        if len(pieces) == 1 and not QUOTE_RE.search(following):
+            # A bare quote paragraph: rule 10b, tag opening the next paragraph.
+            tags = [self._tag(self.post_tag.search(following))]
+        named = [t for t in tags if t]
+        if not named:
+            return None
+        if None in tags:
+            # Untagged quotes only inherit when the paragraph has a single speaker.
+            if len({t[0] for t in named}) != 1:
+                return None
+            tags = [t or named[0] for t in tags]
+
+        rows = []
+        q = 0
+        for kind, piece in pieces:
+            if kind == "narration":
+                rows.append(_row("narrator", "unknown", "neutral", piece))
+            else:
+                name, mood = tags[q]
+                rows.append(_row(name, self.cast.get(name, "unknown"), mood, piece))
+                q += 1
+        return rows
+
+
+def llm_input(paragraphs):
+    """Text to send to the LLM: unresolved paragraphs plus one preceding paragraph of context."""
+    included = []
+    for i, para in enumerate(paragraphs):
+        if para.rows is not None:
+            continue
+        if i > 0 and (not included or included[-1] != i - 1):
+            included.append(i - 1)
+        included.append(i)
+    return "\n".join(paragraphs[i].text for i in included), included
+
+
+class Splicer:
+    """Assign LLM rows back to the paragraphs they came from, in order.
+
+    Rows that match no paragraph text (speaker intros, pronoun-rewritten
+    tags) ride along with the next row that does. Rows that land on a
+    context paragraph are dropped, and unresolved paragraphs the LLM
+    skipped fall back to narrator (rule 10c) so no text is lost.
+
+    Rows can be fed one at a time as they stream in; every call returns
+    the paragraphs that can no longer change, in chapter order.
+    """
+
+    def __init__(self, paragraphs, included, lookahead=6):
+        self.paragraphs = paragraphs
+        self.included = included
+        self.keys = [_norm(paragraphs[i].text) for i in included]
+        self.lookahead = lookahead
+        self.assigned = defaultdict(list)
+        self.pending = []
+        self.pos = 0
+        self.offset = 0  # how far into keys[pos] the rows so far have matched
+        self.done = 0
+
+    def _release(self, upto):
+        out = []
+        for i in range(self.done, upto):
+            para = self.paragraphs[i]
+            if para.rows is None:
+                para.rows = self.assigned[i] or [_row("narrator", "unknown", "neutral", para.text)]
+            out.append(para)
+        self.done = max(self.done, upto)
+        return out
+
+    def ready(self):
+        """Paragraphs before the first LLM span, final before any row arrives."""
+        return self._release(self.included[0] if self.included else len(self.paragraphs))
+
+    def _locate(self, key):
+        """(paragraph, end offset) of a row key within the lookahead, or None.
+
+        Every paragraph is tried for the whole key before any is tried for
+        its first or last EDGE_MATCH_CHARS, so a row is not pulled onto an
+        earlier paragraph that merely shares a name-heavy prefix with it.
+        In the current paragraph only text past the rows already matched
+        counts.
+        """
+        window = range(self.pos, min(len(self.keys), self.pos + self.lookahead))
+        for j in window:
+            start = self.offset if j == self.pos else 0
+            if len(key) < MIN_MATCH_CHARS and j != self.pos:
+                if key == self.keys[j] or (j == self.pos + 1 and self.keys[j].startswith(key)):
+                    return j, len(key)
+                continue
+            at = self.keys[j].find(key, start)
+            if at >= 0:
+                return j, at + len(key)
+        if len(key) <= EDGE_MATCH_CHARS:
+            return None
+        for j in window:
+            start = self.offset if j == self.pos else 0
+            at = self.keys[j].find(key[:EDGE_MATCH_CHARS], start)
+            if at >= 0:
+                return j, min(at + len(key), len(self.keys[j]))
+            at = self.keys[j].find(key[-EDGE_MATCH_CHARS:], start)
+            if at >= 0:
+                return j, at + EDGE_MATCH_CHARS
+        return None
+
+    def feed(self, line):
+        if not line.strip():
+            return []
+        key = _norm(line.split("\t")[-1])
+        found = self._locate(key) if key else None
+        if found is None:
+            self.pending.append(line)
+            return []
+        j, self.offset = found
+        self.assigned[self.included[j]].extend(self.pending + [line])
+        self.pending = []
+        self.pos = j
+        return self._release(self.included[j])
+
+    def finish(self):
+        if self.pending and self.included:
+            self.assigned[self.included[-1]].extend(self.pending)
+            self.pending = []
+        return self._release(len(self.paragraphs))
+
+
+class Renderer:
+    """Turns finished paragraphs into TSV rows, adding the narrator intro
+    before a locally tagged speaker's first line."""
+
+    def __init__(self):
+        self.introduced = set()
+
+    def rows(self, para):
+        out = []
+        for row in para.rows or []:
+            speaker = row.partition("\t")[0]
+            if speaker == "narrator":
+                m = re.search(r"\t(.+) speaks\.$", row)
+                if m:
+                    self.introduced.add(m.group(1))
+            elif speaker not in self.introduced:
+                if para.local:
+                    out.append(_row("narrator", "unknown", "neutral", f"{speaker} speaks."))
+                self.introduced.add(speaker)
+            out.append(row)
+        return out
@@ -0,0 +1,133 @@
+import random
+import re
+import threading
+import time
+
+# === CONFIG ===
+BACKOFF_BASE = 2.0     # seconds for the first retry
+BACKOFF_CAP = 90.0     # never sleep longer than this between retries
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset(value):
+    """Parse rate-limit reset values like '2m59.56s', '7.66s', '120ms' or '30' into seconds."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(num) * _UNIT_SECONDS[unit] for num, unit in parts)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Jittered exponential backoff; honours a server Retry-After when given."""
+    wait = parse_reset(retry_after)
+    if wait is not None:
+        return wait + random.uniform(0, 1)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt))) + 0.5
+
+
+def estimate_tokens(text):
+    """Rough token estimate (~4 chars per token) used to charge the token bucket."""
+    return max(1, len(text) // 4)
+
+
+class _Bucket:
+    def __init__(self, capacity, period=60.0):
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self.rate = self.capacity / period
+        self.stamp = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def sync(self, remaining, now, limit=None, period=60.0):
+        """Never believe we have more left than the server says we do."""
+        if limit:
+            self.capacity = float(limit)
+            self.rate = self.capacity / period
+        self.refill(now)
+        self.level = min(self.level, float(remaining))
+
+    def wait_time(self, amount):
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+class RateLimiter:
+    """Token bucket over requests/min and tokens/min, kept in sync with x-ratelimit-* headers."""
+
+    def __init__(self, requests_per_minute=30, tokens_per_minute=12000):
+        self.requests = _Bucket(requests_per_minute)
+        self.tokens = _Bucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until one request costing `tokens` fits in both buckets, then charge it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                amount = min(tokens, self.tokens.capacity)
+                wait = max(
+                    self.paused_until - now,
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(amount),
+                )
+                if wait <= 0:
+                    self.requests.level -= 1
+                    self.tokens.level -= amount
+                    return
+            time.sleep(min(wait, BACKOFF_CAP))
+
+    def pause(self, seconds):
+        """Stop every worker sharing this limiter for `seconds` (e.g. after a 429)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """Apply the provider's remaining/reset headers (Groq and OpenRouter style).
+
+        Groq reports requests per *day* but tokens per *minute*, so only the
+        token limit is adopted as the bucket size; the requests bucket keeps
+        the configured per-minute rate and is just clamped to what is left.
+        """
+        with self.lock:
+            now = time.monotonic()
+            for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if remaining is None:
+                    continue
+                try:
+                    remaining = float(remaining)
+                    limit = float(headers.get(f"x-ratelimit-limit-{kind}") or 0)
+                except ValueError:
+                    continue
+                bucket.sync(remaining, now, limit=limit if kind == "tokens" else None)
+                reset = parse_reset(headers.get(f"x-ratelimit-reset-{kind}"))
+                if remaining <= 0 and reset:
+                    self.paused_until = max(self.paused_until, now + reset)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(key, requests_per_minute=30, tokens_per_minute=12000):
+    """Return the process-wide limiter for `key` (one per provider/model quota)."""
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(requests_per_minute, tokens_per_minute)
+        return _limiters[key]
@@ -0,0 +1,242 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+from collections import Counter, deque
+
+from corpus_index import find_mentions
+from image_gen import (BASE_QUALITY, PREVIEW_SCHEDULER, PREVIEW_STEPS, Job, RenderOptions, load_manifest,
+                       render, save_manifest)
+from presegment import NOT_NAMES
+from script_store import ScriptReader
+
+# === CONFIG ===
+SCRIPTS_DIR = "LLM_output"
+PROMPTS_FILE = "character_prompts.json"
+OUTPUT_DIR = "assets/scenes"
+SCENE_SIZE = (768, 512)
+MAX_SCENES = 3        # scene windows per chapter, before merging identical neighbours
+MAX_CAST = 2          # characters drawn into one scene
+LOOKBACK = 8          # chapters a near-identical scene can be reused across
+CAST_OVERLAP = 0.5    # Jaccard overlap of the cast for two scenes in one setting to match
+
+NEGATIVE = "blurry, bad anatomy, extra limbs, deformed face, text, watermark"
+STYLE_WORDS = {"masterpiece", "best quality", "anime style", "consistent character design"}
+
+# setting -> (keywords in the script, what the model is asked to draw). First match wins ties.
+SETTINGS = {
+    "banquet": (("banquet", "wedding", "ballroom"), "grand banquet hall, round tables, chandeliers, guests"),
+    "hotel": (("hotel", "lobby", "suite"), "luxury hotel lobby, marble floor, warm lights"),
+    "villa": (("villa", "mansion", "manor"), "luxurious hillside villa, large windows, garden"),
+    "office": (("office", "company", "boardroom", "desk"), "modern corporate office, glass walls, city view"),
+    "car": (("car", "driver", "highway"), "inside a luxury car, night city lights through the window"),
+    "street": (("street", "road", "alley", "crowd"), "busy city street, storefronts, evening"),
+    "bar": (("bar", "club", "nightclub"), "dim bar interior, neon lights, counter"),
+    "prison": (("prison", "cell", "police"), "bleak prison corridor, iron bars, cold light"),
+    "hospital": (("hospital", "ward", "doctor"), "hospital ward, white walls, medical equipment"),
+    "school": (("school", "campus", "classroom"), "university campus, classroom building, trees"),
+    "home": (("home", "house", "bedroom", "kitchen", "living room"), "modest apartment living room, sofa, soft light"),
+    "stage": (("stage", "ring", "arena", "auction"), "raised stage with spotlights, audience in the dark"),
+    "mall": (("mall", "shop", "store", "market"), "shopping mall interior, bright shop windows"),
+    "mountain": (("mountain", "cliff", "valley", "forest", "cave"), "misty mountains, pine forest, cliffs"),
+    "temple": (("temple", "palace", "sect", "courtyard"), "ancient chinese courtyard, temple roofs, stone steps"),
+    "water": (("river", "lake", "sea", "island", "beach"), "riverbank at dusk, water reflections"),
+}
+DEFAULT_SETTING = "street"
+
+_SETTING_RES = {label: re.compile(r"\b(?:" + "|".join(re.escape(w) for w in words) + r")s?\b", re.IGNORECASE)
+                for label, (words, _) in SETTINGS.items()}
+
+
+class Scene:
+    """One illustration slot: where, who, and the first script row it covers."""
+    __slots__ = ("chapter", "row", "setting", "cast", "image")
+
+    def __init__(self, chapter, row, setting, cast):
+        self.chapter = chapter
+        self.row = row
+        self.setting = setting
+        self.cast = cast
+        self.image = None
+
+    def signature(self):
+        return self.setting, tuple(sorted(self.cast))
+
+    def similar(self, other):
+        """Same setting and mostly the same people."""
+        if self.setting != other.setting:
+            return False
+        a, b = set(self.cast), set(other.cast)
+        if not a and not b:
+            return True
+        return len(a & b) / len(a | b) >= CAST_OVERLAP
+
+
+def _chapter_num(path):
+    return int(re.search(r"(\d+)", os.path.basename(path)).group(1))
+
+
+def detect_setting(text):
+    """Most-mentioned setting in `text`, or None."""
+    hits = Counter({label: len(rx.findall(text)) for label, rx in _SETTING_RES.items()})
+    label, count = hits.most_common(1)[0]
+    return label if count else None
+
+
+def window_cast(rows, names):
+    """Characters present in `rows`: speakers and narration mentions, most present first."""
+    counts = Counter()
+    for seg in rows:
+        if seg.speaker in names:
+            counts[seg.speaker] += 2
+        elif seg.speaker.lower() in NOT_NAMES:
+            counts.update(name for name, _ in find_mentions(seg.text, names))
+    return [name for name, _ in counts.most_common(MAX_CAST)]
+
+
+def chapter_scenes(chapter, rows, names, carry=None):
+    """Up to MAX_SCENES scenes for one chapter; a window with no setting
+    keywords stays wherever the story last was (`carry`)."""
+    if not rows:
+        return []
+    size = -(-len(rows) // MAX_SCENES)
+    scenes = []
+    for start in range(0, len(rows), size):
+        window = rows[start:start + size]
+        setting = detect_setting(" ".join(seg.text for seg in window)) or carry or DEFAULT_SETTING
+        scene = Scene(chapter, start, setting, window_cast(window, names))
+        if scenes and scenes[-1].signature() == scene.signature():
+            continue
+        scenes.append(scene)
+        carry = setting
+    return scenes
+
+
+def plan(scenes, output_dir=OUTPUT_DIR):
+    """Point every scene at an image, reusing one for an identical scene anywhere
+    or a near-identical one in the last LOOKBACK chapters. Returns the unique scenes."""
+    exact, recent, unique = {}, deque(), []
+    for scene in scenes:
+        while recent and recent[0].chapter < scene.chapter - LOOKBACK:
+            recent.popleft()
+        match = exact.get(scene.signature()) or next((s for s in reversed(recent) if scene.similar(s)), None)
+        if match:
+            scene.image = match.image
+            continue
+        digest = hashlib.sha1(json.dumps(scene.signature()).encode("utf-8")).hexdigest()[:10]
+        scene.image = os.path.join(output_dir, f"{scene.setting}_{digest}.png")
+        exact[scene.signature()] = scene
+        recent.append(scene)
+        unique.append(scene)
+    return unique
+
+
+def cast_description(name, data):
+    """Name, looks and outfit from the character prompt, without its quality boilerplate."""
+    parts = [p.strip() for p in data["base_prompt"].split(",")]
+    looks = [p for p in parts if p and p.lower() not in STYLE_WORDS and p != name]
+    return f"{name} ({', '.join(looks[:4])}, wearing {data.get('default_outfit', 'casual clothes')})"
+
+
+def scene_prompt(scene, characters):
+    cast = [cast_description(name, characters[name]) for name in scene.cast]
+    subject = " and ".join(cast) if cast else "no people"
+    return f"{BASE_QUALITY}, anime style, {SETTINGS[scene.setting][1]}, {subject}, wide shot, detailed environment"
+
+
+def scene_jobs(unique, characters, options, manifest, force=False):
+    """(jobs, up_to_date) for the unique scenes, keyed like the character renders."""
+    jobs, up_to_date = [], 0
+    for scene in unique:
+        prompt = scene_prompt(scene, characters)
+        seed = int(hashlib.sha256(scene.image.encode("utf-8")).hexdigest(), 16) % 10**8
+        key = options.render_key(prompt, NEGATIVE, seed)
+        if not force and manifest.get(scene.image) == key and os.path.exists(scene.image):
+            up_to_date += 1
+            continue
+        jobs.append(Job(scene.setting, os.path.basename(scene.image), prompt, NEGATIVE, seed, scene.image, key))
+    return jobs, up_to_date
+
+
+def collect(scripts_dir=SCRIPTS_DIR, characters=None, first=None, last=None):
+    """Scenes for every segmented chapter in order."""
+    names = set(characters or ())
+    scenes, carry = [], None
+    for path in sorted(glob.glob(os.path.join(scripts_dir, "chapter_*.txt")), key=_chapter_num):
+        chapter = _chapter_num(path)
+        if (first and chapter < first) or (last and chapter > last):
+            continue
+        found = chapter_scenes(chapter, list(ScriptReader(path)), names, carry)
+        if found:
+            carry = found[-1].setting
+        scenes.extend(found)
+    return scenes
+
+
+def write_index(scenes, output_dir=OUTPUT_DIR):
+    """chapters.json: chapter -> [{"row": first script row, "image": path}], for the video stage."""
+    path = os.path.join(output_dir, "chapters.json")
+    index = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    for chapter in {str(s.chapter) for s in scenes}:
+        index[chapter] = []
+    for scene in scenes:
+        index[str(scene.chapter)].append({"row": scene.row, "image": scene.image})
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-chapter scene illustrations from the segmented scripts")
+    parser.add_argument("--scripts", default=SCRIPTS_DIR)
+    parser.add_argument("--prompts", default=PROMPTS_FILE)
+    parser.add_argument("--out", default=OUTPUT_DIR)
+    parser.add_argument("--first", type=int, help="first chapter to illustrate")
+    parser.add_argument("--last", type=int, help="last chapter to illustrate")
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--scheduler", default=PREVIEW_SCHEDULER)
+    parser.add_argument("--preview", action="store_true", help=f"{PREVIEW_STEPS}-step drafts")
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--dry-run", action="store_true", help="plan and print the scene list only")
+    args = parser.parse_args()
+
+    with open(args.prompts, "r", encoding="utf-8") as f:
+        characters = json.load(f)
+    scenes = collect(args.scripts, characters, args.first, args.last)
+    unique = plan(scenes, args.out)
+    chapters = len({s.chapter for s in scenes})
+    print(f"🎬 {chapters} chapters, {len(scenes)} scenes, {len(unique)} unique images")
+
+    if args.dry_run:
+        for scene in unique:
+            print(f"   chapter_{scene.chapter} row {scene.row}: {scene.setting} {list(scene.cast)}")
+        return
+
+    os.makedirs(args.out, exist_ok=True)
+    options = RenderOptions(steps=PREVIEW_STEPS if args.preview else args.steps, width=SCENE_SIZE[0],
+                            height=SCENE_SIZE[1], scheduler=args.scheduler)
+    manifest = load_manifest(args.out)
+    jobs, up_to_date = scene_jobs(unique, characters, options, manifest, args.force)
+    print(f"🧾 {len(jobs)} scenes to render, {up_to_date} up to date")
+
+    def on_done(path, key):
+        manifest[path] = key
+        save_manifest(args.out, manifest)
+
+    if jobs:
+        render(jobs, options, args.batch_size, args.workers, args.threads, on_done)
+    print(f"📌 Scene index: {write_index(scenes, args.out)}")
+
+
+if __name__ == "__main__":
+    main()
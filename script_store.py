@@ -0,0 +1,245 @@
+import glob
+import json
+import os
+import re
+import sys
+from array import array
+
+# === CONFIG ===
+OUTPUT_DIR = "LLM_output"
+CORPUS_FILE = os.path.join(OUTPUT_DIR, "corpus.tsv")
+
+_ESCAPES = {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": ""}
+_UNESCAPE_RE = re.compile(r"\\(.)")
+_UNESCAPES = {"\\": "\\", "t": "\t", "n": "\n"}
+
+
+class Segment:
+    """One script row: who speaks, how, and what."""
+    __slots__ = ("speaker", "gender", "mood", "text")
+
+    def __init__(self, speaker, gender, mood, text):
+        self.speaker = speaker
+        self.gender = gender
+        self.mood = mood
+        self.text = text
+
+    def __iter__(self):
+        return iter((self.speaker, self.gender, self.mood, self.text))
+
+    def __eq__(self, other):
+        return isinstance(other, Segment) and tuple(self) == tuple(other)
+
+    def __repr__(self):
+        return f"Segment({self.speaker!r}, {self.gender!r}, {self.mood!r}, {self.text[:30]!r})"
+
+    def to_line(self):
+        return "\t".join(_escape(f) for f in self) + "\n"
+
+    @classmethod
+    def from_line(cls, line):
+        return cls(*(_unescape(f) for f in line.rstrip("\n").split("\t")))
+
+
+def _escape(field):
+    return "".join(_ESCAPES.get(ch, ch) for ch in field)
+
+
+def _unescape(field):
+    return _UNESCAPE_RE.sub(lambda m: _UNESCAPES.get(m.group(1), m.group(0)), field)
+
+
+def tsv_row(row):
+    """One raw LLM row with real tabs between fields.
+
+    DIAGLOGUE_PROMPT asks for a literal backslash+t separator, so a row with
+    no real tab has its literal ones converted.
+    """
+    if "\t" not in row and "\\t" in row:
+        return row.replace("\\t", "\t")
+    return row
+
+
+def tsv_text(text):
+    return "\n".join(tsv_row(row) for row in text.split("\n"))
+
+
+def parse_row(row):
+    """Best-effort Segment from one raw LLM row; None for blank rows.
+
+    Fields are split on real tabs, or literal backslash+t (see tsv_row).
+    The model sometimes writes 'mood,text' instead of 'mood<TAB>text' or
+    forgets the fields entirely; the text is kept either way.
+    """
+    fields = [f.strip() for f in tsv_row(row).split("\t")]
+    if not any(fields):
+        return None
+    if len(fields) > 4:
+        fields = fields[:3] + ["\t".join(fields[3:]).strip()]
+    if len(fields) == 3 and "," in fields[2]:
+        mood, text = fields[2].split(",", 1)
+        fields = fields[:2] + [mood.strip(), text.strip()]
+    if len(fields) < 4:
+        return Segment("narrator", "unknown", "neutral", fields[-1])
+    speaker = fields[0].strip("\"'")
+    return Segment(speaker, fields[1].lower(), fields[2].lower(), fields[3])
+
+
+def parse_tsv(text):
+    """Segments from a whole LLM response / legacy script string."""
+    return [s for s in (parse_row(r) for r in text.split("\n")) if s is not None]
+
+
+def _index_path(path):
+    return os.path.splitext(path)[0] + ".idx"
+
+
+def write_script(path, segments):
+    """Write segments plus the row-offset index used for O(1) range reads."""
+    offsets = array("Q", [0])
+    with open(path, "wb") as f:
+        for seg in segments:
+            data = seg.to_line().encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    with open(_index_path(path), "wb") as f:
+        offsets.tofile(f)
+    return path
+
+
+def _is_legacy(path):
+    """Old LLM_output files are one JSON string with the rows inside."""
+    with open(path, "rb") as f:
+        return f.read(1) == b'"'
+
+
+class ScriptReader:
+    """Random-access, streaming view over a stored script (or a slice of the corpus).
+
+    Supports len(), iteration and slicing (reader[a:b] reads only those rows),
+    so chunk workers can load just their share of a chapter.
+    """
+
+    def __init__(self, path, start=0, stop=None):
+        self.path = path
+        self._legacy = None
+        if _is_legacy(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._legacy = parse_tsv(json.load(f))
+            self.offsets = None
+            total = len(self._legacy)
+        else:
+            self.offsets = self._load_index()
+            total = len(self.offsets) - 1
+        self.start = start
+        self.stop = total if stop is None else min(stop, total)
+
+    def _load_index(self):
+        idx = _index_path(self.path)
+        offsets = array("Q")
+        if os.path.exists(idx):
+            with open(idx, "rb") as f:
+                offsets.frombytes(f.read())
+            if offsets and offsets[-1] == os.path.getsize(self.path):
+                return offsets
+        # No (or stale) index: build one in a single pass.
+        offsets = array("Q", [0])
+        with open(self.path, "rb") as f:
+            for line in f:
+                offsets.append(offsets[-1] + len(line))
+        return offsets
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def rows(self, start=0, stop=None):
+        """Segments [start, stop) relative to this view."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        start = max(0, start)
+        if start >= stop:
+            return []
+        a, b = self.start + start, self.start + stop
+        if self._legacy is not None:
+            return self._legacy[a:b]
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[a])
+            data = f.read(self.offsets[b] - self.offsets[a]).decode("utf-8")
+        return [Segment.from_line(line) for line in data.split("\n")[:-1]]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            rows = self.rows(start, stop)
+            return rows if step == 1 else rows[::step]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return self.rows(key, key + 1)[0]
+
+    def __iter__(self):
+        if self._legacy is not None:
+            yield from self._legacy[self.start:self.stop]
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[self.start])
+            for _ in range(len(self)):
+                yield Segment.from_line(f.readline().decode("utf-8"))
+
+
+def _chapter_key(path):
+    return int(re.search(r"(\d+)", os.path.basename(path)).group(1))
+
+
+def build_corpus(output_dir=OUTPUT_DIR, path=CORPUS_FILE):
+    """Concatenate every chapter script into one indexed file plus a chapter map."""
+    chapters = {}
+    offsets = array("Q", [0])
+    files = sorted(glob.glob(os.path.join(output_dir, "chapter_*.txt")), key=_chapter_key)
+    with open(path, "wb") as out:
+        for chapter_path in files:
+            first = len(offsets) - 1
+            for seg in ScriptReader(chapter_path):
+                data = seg.to_line().encode("utf-8")
+                out.write(data)
+                offsets.append(offsets[-1] + len(data))
+            chapters[str(_chapter_key(chapter_path))] = [first, len(offsets) - 1]
+    with open(_index_path(path), "wb") as f:
+        offsets.tofile(f)
+    with open(os.path.splitext(path)[0] + ".json", "w", encoding="utf-8") as f:
+        json.dump(chapters, f)
+    return len(files), len(offsets) - 1
+
+
+def open_chapter(chapter, output_dir=OUTPUT_DIR, corpus=None):
+    """Reader for one chapter, given its number or file name (e.g. 'chapter_12.txt').
+
+    With `corpus`, the rows come from the corpus-wide file instead.
+    """
+    number = _chapter_key(str(chapter)) if not str(chapter).isdigit() else int(chapter)
+    if corpus:
+        with open(os.path.splitext(corpus)[0] + ".json", "r", encoding="utf-8") as f:
+            start, stop = json.load(f)[str(number)]
+        return ScriptReader(corpus, start, stop)
+    return ScriptReader(os.path.join(output_dir, f"chapter_{number}.txt"))
+
+
+def migrate(output_dir=OUTPUT_DIR):
+    """Rewrite legacy JSON-string scripts in the indexed format."""
+    count = 0
+    for path in glob.glob(os.path.join(output_dir, "chapter_*.txt")):
+        if _is_legacy(path):
+            write_script(path, list(ScriptReader(path)))
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "--migrate":
+        print(f"📌 Migrated {migrate()} scripts")
+    elif command == "--corpus":
+        chapters, rows = build_corpus()
+        print(f"📌 {CORPUS_FILE}: {chapters} chapters, {rows} rows")
+    else:
+        print("usage: python script_store.py --migrate | --corpus")
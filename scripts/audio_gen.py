@@ -5,6 +5,14 @@ import asyncio
 import edge_tts
 from pydub import AudioSegment
 import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import http_client
+import tts_cache
+import tts_plan
+from rate_limit import backoff_delay
+from script_store import ScriptReader
 
 AUDIO_DIR = "audio"
 CHAPTERS_DIR = "LLM_output"
@@ -16,13 +24,27 @@ VOICE_MAPPING = {
     "female": "en-US-AriaNeural"
 }
 
+EDGE_TTS_VERSION = getattr(edge_tts, "__version__", None)
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "8"))  # edge-tts requests in flight
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "60"))       # seconds per request
+TTS_RETRIES = int(os.getenv("TTS_RETRIES", "3"))
+
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = "-1002386494312"
 
 async def generate_tts(text, voice, path):
-    """Generate TTS for given text chunk."""
-    communicate = edge_tts.Communicate(text, voice)
-    await communicate.save(path)
+    """Generate TTS for given text chunk, retrying timeouts and service errors."""
+    for attempt in range(TTS_RETRIES + 1):
+        try:
+            communicate = edge_tts.Communicate(text, voice)
+            await asyncio.wait_for(communicate.save(path), TTS_TIMEOUT)
+            return
+        except Exception as e:
+            if attempt == TTS_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"⚠ TTS failed for {text[:30]}... ({e!r}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
 
 def create_silence(ms, path):
     """Create silence mp3."""
@@ -62,59 +84,53 @@ async def process_chapter(chapter_num, index, lines):
     audio_path = os.path.join(AUDIO_DIR, f"chapter_{chapter_number}.mp3")
     os.makedirs(AUDIO_DIR, exist_ok=True)
 
+    def voice_for(seg):
+        if seg.speaker == "narrator":
+            return VOICE_MAPPING["narrator"]
+        return VOICE_MAPPING.get(seg.gender, VOICE_MAPPING["narrator"])
+
+    # Runs of same-voice rows become one request; "..." pauses become silence markers.
+    rows = list(ScriptReader(tsv_path))
+    items = tts_plan.plan(rows, voice_for, tts_plan.budget("edge-tts"))
+    print(tts_plan.summary(items, rows))
+
     chunks = []
-    silence_file = os.path.join(tempfile.gettempdir(), "silence.mp3")
-    create_silence(500, silence_file)
-
-    # tasks = []
-    # async with asyncio.TaskGroup() as tg:
-    with open(tsv_path, "r", encoding="utf-8") as f:
-            content = f.read()
-            lines = content.strip().split("\\n")
-            indx = 1
-            for line in lines:
-                
-                # clean_line = line.encode().decode('unicode_escape')
-                parts = line.split("\\t")
-                actor, gender, mood, text = parts
-                if not text:
-                    continue
-                if actor == "narrator":
-                    voice = VOICE_MAPPING["narrator"]
-                elif gender == "male":
-                    voice = VOICE_MAPPING.get(gender, VOICE_MAPPING["male"])
-                elif gender == "female":
-                    voice = VOICE_MAPPING.get(gender, VOICE_MAPPING["female"])
-                else:
-                    voice = VOICE_MAPPING["narrator"]
-
-                # Handle "..." splits
-                parts = text.split("...")
-                indx += 1
-                for j, part in enumerate(parts):
-                    part = part.strip()
-                    if part:
-                        out_file = os.path.join(tempfile.gettempdir(), f"{chapter_num}_{indx}_{j}.mp3")
-                        await generate_tts(part, voice, out_file)
-                        # tasks.append(tg.create_task(generate_tts(part, voice, out_file)))
-                        chunks.append(out_file)
-                    if j < len(parts) - 1:
-                        chunks.append(silence_file)
-
-                
-    # Wait for TTS tasks to complete
-    # await asyncio.gather(*tasks)
+    jobs = []
+    for i, item in enumerate(items):
+        if isinstance(item, tts_plan.Pause):
+            silence_file = os.path.join(tempfile.gettempdir(), f"silence_{item.ms}.mp3")
+            if not os.path.exists(silence_file):
+                create_silence(item.ms, silence_file)
+            chunks.append(silence_file)
+            continue
+        out_file = os.path.join(tempfile.gettempdir(), f"{chapter_num}_{i}.mp3")
+        jobs.append((item.text, item.voice, out_file))
+        chunks.append(out_file)
+
+    # Fragments are synthesized concurrently; `chunks` already holds them in script order.
+    semaphore = asyncio.Semaphore(TTS_CONCURRENCY)
+
+    async def synthesize(part, voice, out_file):
+        async with semaphore:
+            key = tts_cache.clip_key("edge-tts", EDGE_TTS_VERSION, voice, part)
+            await tts_cache.cached(key, out_file, lambda: generate_tts(part, voice, out_file))
+
+    async with asyncio.TaskGroup() as tg:
+        for job in jobs:
+            tg.create_task(synthesize(*job))
 
     # Combine into final MP3
     combine_audio(chunks, audio_path)
+    print(tts_cache.summary())
 
     # Send to Telegram
-    import requests
     with open(audio_path, "rb") as f:
-        requests.post(
+        http_client.post(
             f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendAudio",
             data={"chat_id": TELEGRAM_CHAT_ID},
-            files={"audio": f}
+            files={"audio": f},
+            timeout=300,
+            idempotent=False
         )
 
     # Delete audio after sending
@@ -6,7 +6,13 @@ import scipy.io.wavfile
 from pydub import AudioSegment
 import subprocess
 import uuid
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import http_client
+import tts_cache
+import tts_plan
+from script_store import ScriptReader
 
 os.environ["XDG_CACHE_HOME"] = f"/tmp/bark_cache_{uuid.uuid4().hex}"
 AUDIO_DIR = "audio"
@@ -19,6 +25,9 @@ VOICE_MAPPING = {
     "female": "v2/en_speaker_9"
 }
 
+BARK_PARAMS = {"text_temp": 0.5, "waveform_temp": 0.5}
+POST_FILTER = "afftdn,loudnorm,highpass=f=100,lowpass=f=8000,acompressor"
+
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = "-1002386494312"
 
@@ -34,8 +43,7 @@ def get_lines_for_chunk(all_lines, chunk_num, total_chunks):
 async def generate_tts(text, voice, path):
     """Generate TTS for given text chunk."""
     try:
-        audio_array = await asyncio.to_thread(generate_audio, text, history_prompt=voice,text_temp=0.5,
-    waveform_temp=0.5)
+        audio_array = await asyncio.to_thread(generate_audio, text, history_prompt=voice, **BARK_PARAMS)
         wav_path = path.replace(".mp3", ".wav")
         scipy.io.wavfile.write(wav_path, SAMPLE_RATE, audio_array)
         
@@ -43,7 +51,7 @@ async def generate_tts(text, voice, path):
             subprocess.run,
             [
                 "ffmpeg", "-y", "-i", wav_path,
-                "-af", "afftdn,loudnorm,highpass=f=100,lowpass=f=8000,acompressor",
+                "-af", POST_FILTER,
                 path
             ],
             check=True
@@ -92,55 +100,41 @@ async def process_chapter(chapter_num, index, lines):
     audio_path = os.path.join(AUDIO_DIR, f"chapter_{chapter_number}.mp3")
     os.makedirs(AUDIO_DIR, exist_ok=True)
 
-    silence_file = create_silence(500, os.path.join(tempfile.gettempdir(), "silence.mp3"))
-
-    with open(tsv_path, "r", encoding="utf-8") as f:
-        content = f.read()
-        all_lines = content.strip().split("\\n")
+    all_lines = ScriptReader(tsv_path)
 
     chunk_num = int(os.getenv("CHUNK_NUM", "0"))
     total_chunks = int(os.getenv("TOTAL_CHUNKS", "1"))
 
     lines_to_process = get_lines_for_chunk(all_lines, chunk_num, total_chunks)
 
-    chunks = []
-    idx = 1
+    def voice_for(seg):
+        if seg.speaker == "narrator":
+            return VOICE_MAPPING["narrator"]
+        return VOICE_MAPPING.get(seg.gender, VOICE_MAPPING["narrator"])
 
-    for line in lines_to_process:
-        parts = line.split("\\t")
-        if len(parts) < 4:
-            continue
-        actor, gender, mood, text = parts
-        if not text:
-            continue
+    items = tts_plan.plan(lines_to_process, voice_for, tts_plan.budget("bark"))
+    print(tts_plan.summary(items, lines_to_process))
 
-        if actor == "narrator":
-            voice = VOICE_MAPPING["narrator"]
-        elif gender == "male":
-            voice = VOICE_MAPPING.get(gender, VOICE_MAPPING["male"])
-        elif gender == "female":
-            voice = VOICE_MAPPING.get(gender, VOICE_MAPPING["female"])
-        else:
-            voice = VOICE_MAPPING["narrator"]
-
-        text_parts = text.split("...")
-        for j, part in enumerate(text_parts):
-            part = part.strip()
-            if part:
-                out_file = os.path.join(tempfile.gettempdir(), f"{chapter_num}_{idx}_{j}.mp3")
-                await generate_tts(part, voice, out_file)
-                chunks.append(out_file)
-            if j < len(text_parts) - 1:
-                chunks.append(silence_file)
-        idx += 1
+    chunks = []
+    for i, item in enumerate(items):
+        if isinstance(item, tts_plan.Pause):
+            chunks.append(create_silence(item.ms, os.path.join(tempfile.gettempdir(), "silence.mp3")))
+            continue
+        out_file = os.path.join(tempfile.gettempdir(), f"{chapter_num}_{chunk_num}_{i}.mp3")
+        key = tts_cache.clip_key("bark", "suno/bark", item.voice, item.text, {**BARK_PARAMS, "filter": POST_FILTER})
+        await tts_cache.cached(key, out_file, lambda: generate_tts(item.text, item.voice, out_file))
+        chunks.append(out_file)
 
     combine_audio(chunks, audio_path)
+    print(tts_cache.summary())
 
     with open(audio_path, "rb") as f:
-        requests.post(
+        http_client.post(
             f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendAudio",
             data={"chat_id": TELEGRAM_CHAT_ID},
-            files={"audio": f}
+            files={"audio": f},
+            timeout=300,
+            idempotent=False
         )
 
     os.remove(audio_path)
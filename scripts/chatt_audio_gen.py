@@ -7,7 +7,13 @@ import scipy.io.wavfile
 from pydub import AudioSegment
 import subprocess
 import uuid
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import http_client
+import tts_cache
+import tts_plan
+from script_store import ScriptReader
 
 model = ChatterboxTTS.from_pretrained(device="cpu")
 AUDIO_DIR = "audio"
@@ -32,6 +38,15 @@ def get_lines_for_chunk(all_lines, chunk_num, total_chunks):
      end = start + base_size + (1 if chunk_num < remainder else 0)
      return all_lines[start:end]
 
+_conds = {}
+
+def use_voice(voice):
+    """Point the model at `voice`, deriving its conditionals only the first time."""
+    if voice not in _conds:
+        model.prepare_conditionals(voice)
+        _conds[voice] = model.conds
+    model.conds = _conds[voice]
+
 async def generate_tts(text, voice, path):
     """Generate TTS for given text chunk."""
     try:
@@ -50,7 +65,8 @@ async def generate_tts(text, voice, path):
     #         check=True
     #     )
     #     os.remove(wav_path)
-        wav = model.generate(text, audio_prompt_path=voice)
+        use_voice(voice)
+        wav = model.generate(text)
         ta.save(path, wav, model.sr)
         
         print(f"✅ Generated TTS for {text[:30]}...")
@@ -97,11 +113,7 @@ async def process_chapter(chapter_num, index, lines):
     
     os.makedirs(AUDIO_DIR, exist_ok=True)
 
-    silence_file = create_silence(500, os.path.join(tempfile.gettempdir(), "silence.mp3"))
-
-    with open(tsv_path, "r", encoding="utf-8") as f:
-        content = f.read()
-        all_lines = content.strip().split("\\n")
+    all_lines = ScriptReader(tsv_path)
 
     chunk_num = int(os.getenv("CHUNK_NUM", "0"))
     audio_path = os.path.join(AUDIO_DIR, f"chunk_{chunk_num}.mp3")
@@ -109,47 +121,42 @@ async def process_chapter(chapter_num, index, lines):
 
     lines_to_process = get_lines_for_chunk(all_lines, chunk_num, total_chunks)
 
-    chunks = []
-    idx = 1
+    def voice_for(seg):
+        if seg.speaker == "Chen Ping":
+            return "sample/Cheng.mp3"
+        if seg.speaker == "narrator":
+            return VOICE_MAPPING["narrator"]
+        return VOICE_MAPPING.get(seg.gender, VOICE_MAPPING["narrator"])
 
-    for line in lines_to_process:
-        parts = line.split("\\t")
-        if len(parts) < 4:
-            continue
-        actor, gender, mood, text = parts
-        if not text:
+    items = tts_plan.plan(lines_to_process, voice_for, tts_plan.budget("chatterbox"))
+    print(tts_plan.summary(items, lines_to_process))
+
+    chunks = []
+    jobs = []
+    for i, item in enumerate(items):
+        if isinstance(item, tts_plan.Pause):
+            chunks.append(create_silence(item.ms, os.path.join(tempfile.gettempdir(), "silence.mp3")))
             continue
+        out_file = os.path.join(tempfile.gettempdir(), f"{chapter_num}_{chunk_num}_{i}.mp3")
+        jobs.append((item.voice, item.text, out_file))
+        chunks.append(out_file)
 
-        if actor == "narrator":
-            voice = VOICE_MAPPING["narrator"]
-        elif gender == "male":
-            voice = VOICE_MAPPING.get(gender, VOICE_MAPPING["male"])
-        elif gender == "female":
-            voice = VOICE_MAPPING.get(gender, VOICE_MAPPING["female"])
-        else:   
-            voice = VOICE_MAPPING["narrator"]
-            
-        if actor == "Chen Ping":
-                voice = "sample/Cheng.mp3"
-
-        text_parts = text.split("...")
-        for j, part in enumerate(text_parts):
-            part = part.strip()
-            if part:
-                out_file = os.path.join(tempfile.gettempdir(), f"{chapter_num}_{idx}_{j}.mp3")
-                await generate_tts(part, voice, out_file)
-                chunks.append(out_file)
-            if j < len(text_parts) - 1:
-                chunks.append(silence_file)
-        idx += 1
+    # One speaker at a time keeps the voice conditioning in place between lines;
+    # `chunks` already holds the files in script order.
+    for voice, part, out_file in sorted(jobs, key=lambda job: job[0]):
+        key = tts_cache.clip_key("chatterbox", "ResembleAI/chatterbox", voice, part)
+        await tts_cache.cached(key, out_file, lambda: generate_tts(part, voice, out_file))
 
     combine_audio(chunks, audio_path)
+    print(tts_cache.summary())
 
     with open(audio_path, "rb") as f:
-        requests.post(
+        http_client.post(
             f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendAudio",
             data={"chat_id": TELEGRAM_CHAT_ID},
-            files={"audio": f}
+            files={"audio": f},
+            timeout=300,
+            idempotent=False
         )
 
     #os.remove(audio_path)
@@ -3,6 +3,10 @@ import os
 import random
 from pathlib import Path
 import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from script_store import ScriptReader
 
 DB_PATH = Path("voice.db")
 
@@ -39,18 +43,7 @@ def update_voice_db(chapter_file):
 
     new_assignments = []
 
-    with open(chapter_file, 'r') as f:
-        content = f.read()
-    all_lines = content.strip().split("\\n")
-
-    for line in all_lines:
-        if not line.strip():
-            continue
-        parts = line.split("\\t")
-        if len(parts) < 4:
-            continue
-        
-        actor_name, gender ,mood, text= parts
+    for actor_name, gender, mood, text in ScriptReader(chapter_file):
         if actor_name not in current:
             voice_file = assign_voice(actor_name, gender, used_voices)
             print(f"Assigning voice: {actor_name} -> {voice_file}")
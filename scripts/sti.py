@@ -5,7 +5,10 @@ import tempfile
 from pydub import AudioSegment
 import subprocess
 import uuid
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import http_client
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = "-1002386494312"
@@ -42,10 +45,12 @@ def main():
     combine_audio(chunk_files, output_file)
     
     with open(output_file, "rb") as f:
-        requests.post(
+        http_client.post(
             f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendAudio",
             data={"chat_id": TELEGRAM_CHAT_ID},
-            files={"audio": f}
+            files={"audio": f},
+            timeout=300,
+            idempotent=False
         )
     os.remove(output_file)
 
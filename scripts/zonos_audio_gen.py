@@ -1,5 +1,6 @@
 import torchaudio as ta
 import torch
+import hashlib
 from zonos.model import Zonos
 from zonos.conditioning import make_cond_dict
 import os
@@ -8,13 +9,20 @@ import asyncio
 from pydub import AudioSegment
 import subprocess
 import uuid
-import requests
 import sqlite3
 from pathlib import Path
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tts_cache
+import tts_plan
+from script_store import ScriptReader
 
 
 device = torch.device("cpu")
-model = Zonos.from_pretrained("Zyphra/Zonos-v0.1-transformer", device=device)
+MODEL_NAME = "Zyphra/Zonos-v0.1-transformer"
+model = Zonos.from_pretrained(MODEL_NAME, device=device)
+SPEAKER_CACHE_DIR = os.getenv("SPEAKER_CACHE_DIR", ".cache/speaker_embeds")
 AUDIO_DIR = "./audio"
 CHAPTERS_DIR = "./LLM_output"
 AUDIO_TMP = "./tmp_audio"
@@ -38,11 +46,37 @@ def get_lines_for_chunk(all_lines, chunk_num, total_chunks):
      end = start + base_size + (1 if chunk_num < remainder else 0)
      return all_lines[start:end]
 
+_speakers = {}
+
+def speaker_embedding(voice):
+    """Speaker embedding for a reference clip, cached in memory and under SPEAKER_CACHE_DIR.
+
+    Keyed by (model, clip content), so a renamed sample reuses its embedding
+    and an edited one gets a new one.
+    """
+    if voice in _speakers:
+        return _speakers[voice]
+    digest = hashlib.sha256(MODEL_NAME.encode("utf-8"))
+    with open(voice, "rb") as f:
+        digest.update(f.read())
+    path = os.path.join(SPEAKER_CACHE_DIR, f"{digest.hexdigest()}.pt")
+    if os.path.exists(path):
+        speaker = torch.load(path, map_location=device)
+    else:
+        wav, sampling_rate = ta.load(voice)
+        with torch.no_grad():
+            speaker = model.make_speaker_embedding(wav, sampling_rate)
+        os.makedirs(SPEAKER_CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        torch.save(speaker, tmp)
+        os.replace(tmp, path)
+    _speakers[voice] = speaker
+    return speaker
+
 async def generate_tts(text, voice, path, mood):
     """Generate TTS for given text chunk."""
     try:
-        wav, sampling_rate = ta.load(voice)
-        speaker = model.make_speaker_embedding(wav, sampling_rate)
+        speaker = speaker_embedding(voice)
         cond_dict = make_cond_dict(
             text=text,
             speaker=speaker,
@@ -108,11 +142,7 @@ async def process_chapter(chapter_num, index, lines):
     os.makedirs(AUDIO_DIR, exist_ok=True)
     os.makedirs(AUDIO_TMP, exist_ok=True)
 
-    silence_file = create_silence(1000, os.path.join(AUDIO_TMP, "silence.mp3"))
-
-    with open(tsv_path, "r", encoding="utf-8") as f:
-        content = f.read()
-        all_lines = content.strip().split("\\n")
+    all_lines = ScriptReader(tsv_path)
 
     chunk_num = int(os.getenv("CHUNK_NUM", "0"))
     audio_path = os.path.join(AUDIO_DIR, f"chunk_{chunk_num}.mp3")
@@ -120,55 +150,37 @@ async def process_chapter(chapter_num, index, lines):
 
     lines_to_process = get_lines_for_chunk(all_lines, chunk_num, total_chunks)
 
-    chunks = []
-    idx = 1
-    
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("SELECT actor_name, voice_file FROM voice_assignments")
     current = dict(cursor.fetchall())
     conn.close()
-    for line in lines_to_process:
-        parts = line.split("\\t")
-        if len(parts) < 4:
-            continue
-        actor, gender, mood, text = parts
-        if not text:
+
+    def voice_for(seg):
+        return f"sample/{current.get(seg.speaker)}"
+
+    items = tts_plan.plan(lines_to_process, voice_for, tts_plan.budget("zonos"), pause_ms=1000)
+    print(tts_plan.summary(items, lines_to_process))
+
+    chunks = []
+    for i, item in enumerate(items):
+        if isinstance(item, tts_plan.Pause):
+            chunks.append(create_silence(item.ms, os.path.join(AUDIO_TMP, "silence.mp3")))
             continue
-        
-        #if actor == "narrator":
-         #   voice = VOICE_MAPPING["narrator"]
-        #elif gender == "male":
-        #    voice = VOICE_MAPPING.get(gender, VOICE_MAPPING["male"])
-        #elif gender == "female":
-        #    voice = VOICE_MAPPING.get(gender, VOICE_MAPPING["female"])
-        #else:   
-         #   voice = VOICE_MAPPING["narrator"]
-            
-        if actor == "Chen Ping":
-                voice = "Cheng.mp3"
-
-        voice = current.get(actor)
-        voice = f"sample/{voice}"
-        # await generate_tts(text, voice, audio_path, mood)
-        text_parts = text.split("...")
-        for j, part in enumerate(text_parts):
-            part = part.strip()
-            if part:
-                out_file = os.path.join(AUDIO_TMP, f"{chapter_num}_{idx}_{j}.mp3")
-                await generate_tts(part, voice, out_file, mood)
-                chunks.append(out_file)
-            if j < len(text_parts) - 1:
-                chunks.append(silence_file)
-        idx += 1
+        out_file = os.path.join(AUDIO_TMP, f"{chapter_num}_{i}.mp3")
+        key = tts_cache.clip_key("zonos", MODEL_NAME, item.voice, item.text, {"language": "en-us"})
+        await tts_cache.cached(key, out_file, lambda: generate_tts(item.text, item.voice, out_file, None))
+        chunks.append(out_file)
 
     combine_audio(chunks, audio_path)
+    print(tts_cache.summary())
 
     # with open(audio_path, "rb") as f:
-    #     requests.post(
+    #     http_client.post(
     #         f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendAudio",
     #         data={"chat_id": TELEGRAM_CHAT_ID},
-    #         files={"audio": f}
+    #         files={"audio": f},
+    #         timeout=300
     #     )
 
     #os.remove(audio_path)
@@ -5,6 +5,7 @@ import json
 import logging
 import requests
 import trafilatura
+import http_client
 from flask import Flask, request
 import logging
 import edge_tts
@@ -43,7 +44,7 @@ def send_telegram_message(chat_id, text):
         "text": text[:4090] + '...' if len(text) > 4096 else text
     }
     try:
-        response = requests.post(TELEGRAM_SEND_MESSAGE_URL, json=payload, timeout=15)
+        response = http_client.post(TELEGRAM_SEND_MESSAGE_URL, json=payload, timeout=15, idempotent=False)
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
         logger.error(f"Error sending message: {e}")
@@ -53,7 +54,8 @@ def send_telegram_audio(chat_id, audio_data):
     try:
         files = {'audio': ('audio.mp3', audio_data, 'audio/mpeg')}
         data = {'chat_id': chat_id}
-        response = requests.post(TELEGRAM_SEND_AUDIO_URL, files=files, data=data, timeout=15)
+        response = http_client.post(TELEGRAM_SEND_AUDIO_URL, files=files, data=data, timeout=15,
+                                    idempotent=False)
         response.raise_for_status()
         logger.info(response.headers.get("Content-Type"))
         logger.info(response.text)
@@ -63,7 +65,7 @@ def send_telegram_audio(chat_id, audio_data):
 def custom_fetch(url):
     headers = {'User-Agent': 'Mozilla/5.0'}
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = http_client.get(url, headers=headers, timeout=10)
         if response.ok:
             return trafilatura.extract(response.text)
         else:
@@ -124,7 +126,7 @@ Now process this story:\n{content}
     "temperature": 0.2
 }
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = http_client.post(url, headers=headers, json=payload, timeout=120)
     print(response.json()["choices"][0]["message"]["content"])
 
     json_content = response.json()["choices"][0]["message"]["content"]
@@ -0,0 +1,67 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mock_llm import fake_script
+from presegment import Paragraph, Splicer, _norm, _row, llm_input
+
+
+def splice(texts, local):
+    """Run a perfect LLM's rows for the unresolved paragraphs through the Splicer."""
+    paragraphs = [Paragraph(t) for t in texts]
+    for i in local:
+        paragraphs[i].rows = [_row("narrator", "unknown", "neutral", texts[i])]
+        paragraphs[i].local = True
+    text, included = llm_input(paragraphs)
+    splicer = Splicer(paragraphs, included)
+    splicer.ready()
+    for line in fake_script(text).split("\n"):
+        splicer.feed(line)
+    splicer.finish()
+    return paragraphs
+
+
+def assert_each_paragraph_voiced_once(paragraphs):
+    for para in paragraphs:
+        voiced = "".join(row.split("\t")[-1] for row in para.rows)
+        assert _norm(voiced) == _norm(para.text), para.text
+
+
+def test_context_row_does_not_attach_to_a_paragraph_sharing_its_prefix():
+    # Chapter 265: the context row for paragraph 3 shares "Li Weijian and Chen
+    # Baoqiang" with paragraph 1 and used to be attached there as well.
+    paragraphs = splice([
+        "“Mr. Chen, I will investigate this matter thoroughly!”",
+        "Ling Zhenchuan finished and looked at Li Weijian and Chen Baoqiang, “You two are removed "
+        "from your posts from today and will be investigated when the time comes, if you are found "
+        "to be corrupt, you will be severely punished!”",
+        "Poof …………",
+        "Li Weijian and Chen Baoqiang all sat down paralyzed with fear, if they were investigated, "
+        "none of them would be able to escape!",
+        "“Who are you?”",
+    ], local=[2, 3])
+    assert_each_paragraph_voiced_once(paragraphs)
+
+
+def test_quote_lands_on_its_own_paragraph_not_the_one_sharing_its_suffix():
+    # Chapter 30: paragraph 2's quote ends like paragraph 1's and used to land
+    # there, leaving paragraph 2 to the narrator fallback.
+    paragraphs = splice([
+        "The fat stall owner knew that once the words “Gathering of Righteousness Hall” were "
+        "uttered, even if the King of Heaven came, he would tremble.",
+        "“Gathering of Righteousness Hall?” Chen Ping smiled coldly, “If I say I’m not afraid of "
+        "the Hall of Righteousness, what can you do?”",
+        "“Who is not afraid of the Hall of Righteousness?”",
+        "As soon as Chen Ping’s words left his mouth, a harsh voice came out.",
+    ], local=[3])
+    assert_each_paragraph_voiced_once(paragraphs)
+    assert not paragraphs[2].rows[0].startswith("narrator")
+
+
+def test_short_row_starts_the_next_paragraph():
+    # "Not enough?" also occurs earlier in the current paragraph.
+    paragraphs = splice([
+        "“It’s not enough!” Chen Ping shook his head.",
+        "“Not enough?” Doctor Sun was stunned, “This packet has more than thirty of them!”",
+    ], local=[])
+    assert_each_paragraph_voiced_once(paragraphs)
@@ -0,0 +1,112 @@
+import hashlib
+import inspect
+import json
+import os
+import re
+import threading
+import unicodedata
+
+from lru_store import LRUStore
+
+# === CONFIG ===
+CACHE_PATH = os.getenv("TTS_CACHE_PATH", ".cache/tts_clips.sqlite")
+CACHE_MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", "1024"))
+CACHE_ENABLED = os.getenv("TTS_CACHE", "1") != "0"
+
+_SPACE_RE = re.compile(r"\s+")
+_file_digests = {}
+
+
+def normalize_text(text):
+    """The text as the engine hears it: NFKC, single spaces, no edge whitespace."""
+    return _SPACE_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def voice_id(voice):
+    """Reference clips are identified by content, so re-pointing a name at a new sample misses."""
+    if not os.path.isfile(voice):
+        return voice
+    if voice not in _file_digests:
+        with open(voice, "rb") as f:
+            _file_digests[voice] = hashlib.sha256(f.read()).hexdigest()
+    return _file_digests[voice]
+
+
+def clip_key(engine, model, voice, text, params=None, seed=None):
+    """Content hash of everything that determines a synthesized clip."""
+    blob = json.dumps(
+        [engine, model, voice_id(voice), normalize_text(text), params or {}, seed],
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ClipCache(LRUStore):
+    """SQLite-backed audio clip cache with size-bounded LRU eviction.
+
+    Clips are stored as the encoded bytes the engine wrote (mp3 for every
+    script here), so a hit is a single file write.
+    """
+
+    table = "tts_clips"
+    label = "TTS cache"
+    noun = "clips"
+
+    def __init__(self, path=CACHE_PATH, max_bytes=int(CACHE_MAX_MB * 1024 * 1024)):
+        super().__init__(path, max_bytes)
+
+    def get(self, key, path):
+        """Write the cached clip to `path`; False on a miss."""
+        audio = self._get(key)
+        if audio is None:
+            return False
+        with open(path, "wb") as f:
+            f.write(audio)
+        return True
+
+    def put(self, key, path):
+        """Store the clip at `path`; missing or empty files (failed synthesis) are skipped."""
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return
+        with open(path, "rb") as f:
+            audio = f.read()
+        self._put(key, audio, len(audio))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide cache, or None when disabled with TTS_CACHE=0."""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ClipCache()
+        return _cache
+
+
+async def cached(key, path, make):
+    """Fill `path` from the cache, or call `make()` (sync or async) to synthesize
+    it there and keep the result.
+
+    Any earlier file at `path` is removed first: the engines swallow their
+    own errors, and a stale clip must never be stored under a new key.
+    """
+    cache = get_cache()
+    if cache and cache.get(key, path):
+        return
+    if os.path.exists(path):
+        os.remove(path)
+    result = make()
+    if inspect.isawaitable(result):
+        await result
+    if cache:
+        cache.put(key, path)
+
+
+def summary():
+    cache = get_cache()
+    return cache.summary() if cache else "TTS cache: disabled"
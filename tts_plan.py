@@ -0,0 +1,94 @@
+import os
+
+# === CONFIG ===
+MAX_CHARS = int(os.getenv("TTS_MAX_CHARS", "0"))  # 0 = engine default below; negative = never merge
+PAUSE_MS = 500
+
+# Characters per request each engine handles well: edge-tts streams long text,
+# the local models drift or truncate past roughly 20-30 s of speech.
+ENGINE_MAX_CHARS = {
+    "edge-tts": 1500,
+    "zonos": 300,
+    "chatterbox": 300,
+    "bark": 180,
+}
+
+
+class Request:
+    """One TTS call: consecutive script text in a single voice."""
+    __slots__ = ("voice", "text", "first_row", "last_row")
+
+    def __init__(self, voice, text, row):
+        self.voice = voice
+        self.text = text
+        self.first_row = row
+        self.last_row = row
+
+    def __repr__(self):
+        return f"Request({self.voice!r}, rows {self.first_row}-{self.last_row}, {self.text[:30]!r})"
+
+
+class Pause:
+    """Explicit silence between two requests, where an ellipsis fell on a request boundary."""
+    __slots__ = ("ms",)
+
+    def __init__(self, ms=PAUSE_MS):
+        self.ms = ms
+
+    def __repr__(self):
+        return f"Pause({self.ms})"
+
+
+def budget(engine):
+    if MAX_CHARS:
+        return max(0, MAX_CHARS)
+    return ENGINE_MAX_CHARS.get(engine, 300)
+
+
+def plan(rows, voice_for, max_chars, pause_text=" … ", pause_ms=PAUSE_MS):
+    """[Request | Pause] covering `rows` in script order.
+
+    Consecutive rows with the same `voice_for(segment)` are merged into one
+    request while it stays within `max_chars`. An ellipsis inside a merged
+    request is written as `pause_text`, so the engine pauses without another
+    call; where one falls between two requests it becomes a Pause marker
+    instead. A row longer than the budget still becomes one request.
+    """
+    items = []
+    current = None
+    pauses = 0
+    for row, seg in enumerate(rows):
+        if not seg.text:
+            continue
+        voice = voice_for(seg)
+        pieces = seg.text.split("...")
+        for j, piece in enumerate(pieces):
+            piece = piece.strip()
+            if piece:
+                joiner = pause_text if pauses else " "
+                if (current is not None and current.voice == voice
+                        and len(current.text) + len(joiner) + len(piece) <= max_chars):
+                    current.text += joiner + piece
+                    current.last_row = row
+                else:
+                    if pauses:
+                        items.append(Pause(pause_ms * pauses))
+                    current = Request(voice, piece, row)
+                    items.append(current)
+                pauses = 0
+            if j < len(pieces) - 1:
+                pauses += 1
+    if pauses:
+        items.append(Pause(pause_ms * pauses))
+    return items
+
+
+def requests(items):
+    return [item for item in items if isinstance(item, Request)]
+
+
+def summary(items, rows):
+    """Calls saved compared with one call per row fragment."""
+    fragments = sum(len([p for p in seg.text.split("...") if p.strip()]) for seg in rows if seg.text)
+    calls = len(requests(items))
+    return f"TTS plan: {calls} requests for {fragments} fragments ({1 - calls / (fragments or 1):.0%} fewer calls)"
@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import tempfile
+
+from script_store import open_chapter
+
+# === CONFIG ===
+SCRIPTS_DIR = "LLM_output"
+SCENES_INDEX = "assets/scenes/chapters.json"
+CHARACTERS_DIR = "assets/characters_new"
+VIDEO_DIR = "video"
+SIZE = (768, 512)
+MIN_SHOT = 3.0       # seconds; shorter shots are folded into the previous image
+PAUSE_WEIGHT = 12    # a row costs len(text) + this many characters of audio ("..." pauses, gaps)
+
+
+class Shot:
+    __slots__ = ("image", "start", "duration")
+
+    def __init__(self, image, start, duration):
+        self.image = image
+        self.start = start
+        self.duration = duration
+
+
+def audio_duration(path):
+    out = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+                         check=True, capture_output=True, text=True).stdout
+    return float(out.strip())
+
+
+def row_times(rows, total):
+    """Start time of every row, sharing `total` seconds by text length.
+
+    The TTS reads at a near-constant rate, so characters are a good proxy
+    for time; each row also pays for the gap between clips.
+    """
+    weights = [len(seg.text) + PAUSE_WEIGHT for seg in rows]
+    scale = total / (sum(weights) or 1)
+    starts, t = [], 0.0
+    for w in weights:
+        starts.append(t)
+        t += w * scale
+    return starts
+
+
+def scene_images(chapter, rows, index_path=SCENES_INDEX):
+    """Image per row from scene_gen's chapters.json, or None if the chapter has no scenes."""
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, "r", encoding="utf-8") as f:
+        scenes = json.load(f).get(str(chapter))
+    if not scenes:
+        return None
+    images, current = [], scenes[0]["image"]
+    marks = {s["row"]: s["image"] for s in scenes}
+    for i in range(len(rows)):
+        current = marks.get(i, current)
+        images.append(current)
+    return images
+
+
+def speaker_images(rows, characters_dir=CHARACTERS_DIR):
+    """Image per row: the speaker's portrait, holding the last one through narration."""
+    images, current = [], None
+    for seg in rows:
+        path = os.path.join(characters_dir, seg.speaker, "character.png")
+        if os.path.exists(path):
+            current = path
+        images.append(current)
+    first = next((img for img in images if img), None)
+    return [img or first for img in images]
+
+
+def plan_shots(images, starts, total, min_shot=MIN_SHOT):
+    """Collapse per-row images into shots: one entry per image change."""
+    shots = []
+    for image, start in zip(images, starts):
+        if image is None or (shots and shots[-1].image == image):
+            continue
+        if shots and start - shots[-1].start < min_shot:
+            if len(shots) > 1 and shots[-2].image == image:
+                shots.pop()
+            else:
+                shots[-1].image = image
+            continue
+        shots.append(Shot(image, 0.0 if not shots else start, 0.0))
+    for shot, nxt in zip(shots, shots[1:] + [None]):
+        shot.duration = (nxt.start if nxt else total) - shot.start
+    return shots
+
+
+def write_concat(shots, path):
+    """ffconcat list with per-image durations; the last image is repeated so its duration holds."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("ffconcat version 1.0\n")
+        for shot in shots:
+            f.write(f"file '{os.path.abspath(shot.image)}'\nduration {shot.duration:.3f}\n")
+        f.write(f"file '{os.path.abspath(shots[-1].image)}'\n")
+
+
+def encode(shots, audio, output, size=SIZE):
+    """Encode each still once (variable frame rate) and copy the audio stream as-is."""
+    w, h = size
+    with tempfile.TemporaryDirectory() as tmp:
+        concat = os.path.join(tmp, "shots.ffconcat")
+        write_concat(shots, concat)
+        cmd = [
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "concat", "-safe", "0", "-i", concat,
+            "-i", audio,
+            "-map", "0:v", "-map", "1:a",
+            "-vf", f"scale={w}:{h}:force_original_aspect_ratio=decrease,"
+                   f"pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,format=yuv420p",
+            "-fps_mode", "vfr",
+            "-c:v", "libx264", "-preset", "veryfast", "-tune", "stillimage",
+            "-c:a", "copy",
+            "-movflags", "+faststart",
+            output,
+        ]
+        subprocess.run(cmd, check=True)
+    return output
+
+
+def chapter_video(audio, chapter, output=None, scripts_dir=SCRIPTS_DIR, mode="auto"):
+    rows = list(open_chapter(chapter, scripts_dir))
+    total = audio_duration(audio)
+    images = scene_images(chapter, rows) if mode in ("auto", "scenes") else None
+    if images is None:
+        images = speaker_images(rows)
+    # Scene rows index the whole script; empty rows are dropped only after
+    # images are assigned, since audio_gen does not voice them.
+    spoken = [i for i, seg in enumerate(rows) if seg.text]
+    rows, images = [rows[i] for i in spoken], [images[i] for i in spoken]
+    shots = plan_shots(images, row_times(rows, total), total)
+    if not shots:
+        raise ValueError(f"no images for chapter {chapter}; run scene_gen.py or image_gen.py first")
+    output = output or os.path.join(VIDEO_DIR, f"chapter_{chapter}.mp4")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    encode(shots, audio, output)
+    print(f"🎞 {output}: {len(shots)} shots over {total:.0f}s")
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Still-image MP4 for a finished chapter audio file")
+    parser.add_argument("audio", help="chapter audio, e.g. audio/chapter_12.mp3")
+    parser.add_argument("--chapter", help="chapter number (default: from the audio file name)")
+    parser.add_argument("--out")
+    parser.add_argument("--scripts", default=SCRIPTS_DIR)
+    parser.add_argument("--mode", choices=["auto", "scenes", "speakers"], default="auto",
+                        help="scene illustrations, speaker portraits, or scenes when the chapter has them")
+    args = parser.parse_args()
+
+    chapter = args.chapter or re.search(r"(\d+)", os.path.basename(args.audio)).group(1)
+    chapter_video(args.audio, int(chapter), args.out, args.scripts, args.mode)
+
+
+if __name__ == "__main__":
+    main()